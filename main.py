@@ -45,7 +45,7 @@ class Engine:
         # Update time
         self.dt = self.clock.tick() / 1000
         self.time += self.dt
-        pg.display.set_caption(f"FPS: {round(self.clock.get_fps())} | Objects: {len(self.project.current_scene.object_handler.objects)}")
+        pg.display.set_caption(f"FPS: {round(self.clock.get_fps())} | Objects: {len(self.project.current_scene.object_handler.objects)} | Culled chunks: {self.project.current_scene.object_handler.culled_chunks}")
         # Pygame events
         self.events = pg.event.get()
         self.keys = pg.key.get_pressed()
@@ -1,4 +1,5 @@
 import glm
+import numpy as np
 import pygame as pg
 
 # Camera view constants
@@ -34,12 +35,15 @@ class Camera:
         self.m_view = self.get_view_matrix()
         # Projection matrix
         self.m_proj = self.get_projection_matrix()
+        # Planes of the view frustum
+        self.frustum_planes = self.get_frustum_planes()
 
     def update(self) -> None:
         self.move()
         self.rotate()
         self.update_camera_vectors()
         self.m_view = self.get_view_matrix()
+        self.frustum_planes = self.get_frustum_planes()
 
     def rotate(self) -> None:
         """
@@ -91,9 +95,34 @@ class Camera:
         self.m_view = self.get_view_matrix()
         # Projection matrix
         self.m_proj = self.get_projection_matrix()
+        # Planes of the view frustum
+        self.frustum_planes = self.get_frustum_planes()
 
     def get_view_matrix(self) -> glm.mat4x4:
         return glm.lookAt(self.position, self.position + self.forward, self.up)
 
     def get_projection_matrix(self) -> glm.mat4x4:
         return glm.perspective(glm.radians(FOV), self.aspect_ratio, NEAR, FAR)
+
+    def get_frustum_planes(self) -> np.ndarray:
+        """
+        Extracts the six frustum planes from m_proj * m_view.
+        Returns a (6, 4) array of normalized planes (a, b, c, d) in the order left, right, bottom, top, near, far.
+        A point p is inside a plane when dot((a, b, c), p) + d >= 0.
+        """
+
+        # Rows of the view projection matrix
+        m = np.array(self.m_proj * self.m_view, dtype='f4')
+
+        planes = np.array([
+            m[3] + m[0],  # Left
+            m[3] - m[0],  # Right
+            m[3] + m[1],  # Bottom
+            m[3] - m[1],  # Top
+            m[3] + m[2],  # Near
+            m[3] - m[2],  # Far
+        ])
+
+        # Normalize so that plane distances are in world units
+        planes /= np.linalg.norm(planes[:,:3], axis=1)[:,None]
+        return planes
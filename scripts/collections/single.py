@@ -172,6 +172,9 @@ class Single(SuperCollection):
         if self.collider:
             if parent: self.collider.collection = parent
             else:      self.collider.collection = self
+
+        # objects moved by physics are rendered in the object handler's dynamic layer
+        if self.object: self.object.dynamic = (parent or self).is_dynamic()
     
     @property
     def collider(self): return self._collider
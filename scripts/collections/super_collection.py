@@ -59,6 +59,12 @@ class SuperCollection():
         self.update_rotation = False
         self.update_scale    = False
 
+    def is_dynamic(self) -> bool:
+        """
+        Returns whether the collection is moved by physics, either by a physics body or a non-static collider.
+        """
+        return self.physics_body is not None or any(not collider.static for collider in self.get_colliders())
+
     # position
     @property
     def position(self): 
@@ -4,8 +4,8 @@ class vec3(list):
         super().__init__(item for item in iterable)
 
     def __setitem__(self, index, item):
-        if self.update_func: self.update_func()
         super().__setitem__(index, item)
+        if self.update_func: self.update_func()
     
     @property
     def x(self):
@@ -25,4 +25,73 @@ class vec3(list):
         self[1] = value
     @z.setter
     def z(self, value):
-        self[2] = value
\ No newline at end of file
+        self[2] = value
+
+
+class vec3_view:
+    """
+    vec3 backed by a row of one of the object pool's arrays. Reads and writes go straight to the array.
+    The row is looked up on every access since the pool can move the object or reallocate its arrays.
+    Writes only set the object's bit in the pool's dirty mask. The changes are resolved once per frame by the object handler.
+    Accessing the view of a removed object raises a ValueError.
+    """
+    __slots__ = ('object', 'field')
+
+    def __init__(self, object, field):
+        self.object = object
+        self.field = field
+
+    @property
+    def row(self):
+        return getattr(self.object.pool, self.field)[self.object.row]
+
+    def __getitem__(self, index):
+        return self.row[index].tolist()
+
+    def __setitem__(self, index, item):
+        pool, i = self.object.pool, self.object.row
+        getattr(pool, self.field)[i, index] = item
+        pool.dirty[i] = True
+
+    def __iter__(self):
+        return iter(self.row.tolist())
+
+    def __len__(self):
+        return 3
+
+    def __repr__(self):
+        return f'vec3_view({self.row.tolist()})'
+
+    @property
+    def x(self):
+        return self[0]
+    @property
+    def y(self):
+        return self[1]
+    @property
+    def z(self):
+        return self[2]
+
+    @x.setter
+    def x(self, value):
+        self[0] = value
+    @y.setter
+    def y(self, value):
+        self[1] = value
+    @z.setter
+    def z(self, value):
+        self[2] = value
+
+
+class LazyDict(dict):
+    """
+    Dict that creates the value of a missing key with a loader on its first access.
+    Membership tests and iteration only see the values that have been loaded.
+    """
+    def __init__(self, loader):
+        super().__init__()
+        self.loader = loader
+
+    def __missing__(self, key):
+        self[key] = value = self.loader(key)
+        return value
@@ -1,4 +1,5 @@
 import glm
+import numpy as np
 from math import sin, cos
 
 # getting support points
@@ -50,6 +51,27 @@ def get_rotation_matrix(rotation) -> glm.mat3x3:
         -sin(rotation[1])            , cos(rotation[1]) * sin(rotation[0])                                       , cos(rotation[1]) * cos(rotation[0])                                       ,
     )
 
+def get_model_matrices(positions:np.ndarray, rotations:np.ndarray, scales:np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Vectorized model and normal matrices for n objects, built the same way as m_model in batch.vert.
+    Takes (n, 3) arrays. Returns (n, 16) model matrices and (n, 9) normal matrices, flattened column by column like GLSL matrices.
+    """
+    sx, sy, sz = np.sin(rotations).T
+    cx, cy, cz = np.cos(rotations).T
+    # columns of the rotation matrix
+    rotation = np.empty(shape=(len(positions), 3, 3), dtype='f4')
+    rotation[:,0] = np.stack([cz * cy, cz * sy * sx - sz * cx, cz * sy * cx + sz * sx], axis=1)
+    rotation[:,1] = np.stack([sz * cy, sz * sy * sx + cz * cx, sz * sy * cx - cz * sx], axis=1)
+    rotation[:,2] = np.stack([-sy, cy * sx, cy * cx], axis=1)
+    # model matrix = translation * rotation * scale
+    model = np.zeros(shape=(len(positions), 4, 4), dtype='f4')
+    model[:,:3,:3] = rotation * scales[:,:,None]
+    model[:,3,:3]  = positions
+    model[:,3,3]   = 1
+    # transpose(inverse(rotation * scale)) is rotation * inverse(scale) since the rotation is orthonormal
+    normal = rotation / scales[:,:,None]
+    return model.reshape(-1, 16), normal.reshape(-1, 9)
+
 # collision formulas  
 def get_aabb_collision(top_right1, bottom_left1, top_right2, bottom_left2, epsilon:float=1) -> bool:
     return all(bottom_left1[i] <= top_right2[i] + epsilon and epsilon + top_right1[i] >= bottom_left2[i] for i in range(3))
\ No newline at end of file
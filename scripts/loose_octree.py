@@ -0,0 +1,127 @@
+import numpy as np
+from math import ceil, log2
+
+
+CHUNK_SIZE = 40
+MAX_LEVEL  = 8  # Cells on the top level are CHUNK_SIZE * 2 ** MAX_LEVEL wide
+
+CHILD_OFFSETS = [(x, y, z) for x in (0, 1) for y in (0, 1) for z in (0, 1)]
+
+
+class LooseOctree:
+    """
+    Multi-level chunk hierarchy. Chunk keys are (x, y, z, level) and cells on a level are CHUNK_SIZE * 2 ** level wide.
+    Cells are loose: their bounds extend half a cell past the cell on every side.
+    An object is put in the cell containing its center on the smallest level its radius fits in, so it never extends past its chunk's loose bounds.
+    """
+    def __init__(self, chunk_size: float=CHUNK_SIZE, max_level: int=MAX_LEVEL) -> None:
+        self.chunk_size = chunk_size
+        self.max_level  = max_level
+
+        self.chunks   = set()  # Keys of the populated chunks
+        self.children = {}     # Contains sets of the child keys for every node with populated chunks below it
+        self.roots    = set()  # Nodes on the top level
+
+    def get_chunk(self, position, radius: float) -> tuple:
+        """
+        Returns the key of the chunk an object with the given position and bounding radius belongs in
+        """
+
+        # Smallest level where the radius is at most half the cell size
+        level = 0
+        if radius > self.chunk_size / 2: level = min(self.max_level, ceil(log2(2 * radius / self.chunk_size)))
+
+        size = self.chunk_size * 2 ** level
+        return (int(position[0] // size), int(position[1] // size), int(position[2] // size), level)
+
+    def get_chunks(self, positions: np.ndarray, radii: np.ndarray) -> np.ndarray:
+        """
+        Vectorized get_chunk. Returns an (n, 4) int array of chunk keys for (n, 3) positions and (n,) radii.
+        """
+
+        levels = np.ceil(np.log2(np.maximum(2 * radii / self.chunk_size, 1)))
+        levels = np.clip(levels, 0, self.max_level).astype('i4')
+
+        sizes = self.chunk_size * 2.0 ** levels
+        keys = np.empty(shape=(len(positions), 4), dtype='i4')
+        keys[:,:3] = np.floor(positions / sizes[:,None])
+        keys[:,3]  = levels
+        return keys
+
+    def get_parent(self, key: tuple) -> tuple:
+        x, y, z, level = key
+        return (x >> 1, y >> 1, z >> 1, level + 1)
+
+    def get_bounds(self, keys: np.ndarray) -> tuple:
+        """
+        Returns the centers and half sizes of the loose bounds of the given (n, 4) array of keys
+        """
+
+        size = self.chunk_size * 2.0 ** keys[:,3]
+        centers = (keys[:,:3] + 0.5) * size[:,None]
+
+        # The loose bounds are twice the size of the cell
+        return centers, size
+
+    def insert(self, key: tuple) -> None:
+        """
+        Adds a populated chunk and all of its missing ancestors to the tree
+        """
+
+        self.chunks.add(key)
+
+        # Link the chain of ancestors until an existing node is found
+        while key[3] < self.max_level:
+            parent = self.get_parent(key)
+            exists = parent in self.children
+            if not exists: self.children[parent] = set()
+            self.children[parent].add(key)
+            if exists: return
+            key = parent
+
+        self.roots.add(key)
+
+    def remove(self, key: tuple) -> None:
+        """
+        Removes a populated chunk and any ancestors that are left empty
+        """
+
+        self.chunks.discard(key)
+
+        # Unlink nodes that no longer have anything below them
+        while key not in self.chunks and not self.children.get(key):
+            if key in self.children: del self.children[key]
+            if key[3] == self.max_level:
+                self.roots.discard(key)
+                return
+            parent = self.get_parent(key)
+            self.children[parent].discard(key)
+            key = parent
+
+    def traverse(self, test) -> list:
+        """
+        Walks down the tree one level at a time, only descending into nodes that pass the test.
+        Returns the keys of the populated chunks that passed.
+        Args:
+            test: function(centers, half_sizes) -> np.ndarray
+                Vectorized test over the loose bounds of all nodes on a level. Returns a bool mask of the nodes that pass.
+        """
+
+        hits = []
+        frontier = list(self.roots)
+
+        while frontier:
+            # Test the whole level in one pass
+            centers, half_sizes = self.get_bounds(np.array(frontier))
+            passed = np.flatnonzero(test(centers, half_sizes))
+
+            # Collect the chunks that passed and descend into their children
+            next_frontier = []
+            for i in passed:
+                key = frontier[i]
+                if key in self.chunks: hits.append(key)
+                if key in self.children: next_frontier.extend(self.children[key])
+
+            frontier = next_frontier
+
+        return hits
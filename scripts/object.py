@@ -1,94 +1,102 @@
-from scripts.generic.data_types import vec3
-
-
-CHUNK_SIZE = 40
+import numpy as np
+from scripts.generic.data_types import vec3_view
 
 
 class Object:
-    def __init__(self, handler, vbo, texture, position: tuple, rotation: tuple, scale: tuple) -> None:
-        # Rendering specifications
+    """
+    View of an object stored in the object handler's pool. All data lives in the pool's arrays at this object's index.
+    """
+    __slots__ = ('handler', 'pool', 'index', '_position', '_rotation', '_scale')
+
+    def __init__(self, handler, index: int) -> None:
         self.handler = handler
-        self.vbo     = vbo
-        self.texture = texture
+        self.pool    = handler.pool
+
+        # Row of the object's data in the pool. The index changes if another object is removed from the pool, and is None once this object is removed
+        self.index = index
+
+        # Views of the model data. Created once so writing a component does not allocate
+        self._position = vec3_view(self, 'positions')
+        self._rotation = vec3_view(self, 'rotations')
+        self._scale    = vec3_view(self, 'scales')
 
-        # Chunk that the object is in
-        self.chunk = (position[0] // CHUNK_SIZE, position[1] // CHUNK_SIZE, position[2] // CHUNK_SIZE)
-        self.prev_chunk = self.chunk
-        
-        # Variables for detecting attribute changes
-        self.prev_position = [0, 0, 0]
-        self.prev_rotation = [0, 0, 0]
-        self.prev_scale    = [1, 1, 1]
+    @property
+    def row(self) -> int:
+        """
+        Index of the object's row in the pool. Raises a ValueError if the object has been removed, since its row may belong to another object.
+        """
 
-        # Model matrix vectors
-        self.position = vec3(position, self.update_position)
-        self.rotation = vec3(rotation, self.update_rotation)
-        self.scale    = vec3(scale   , self.update_scale)  
+        if self.index is None: raise ValueError('Object has been removed from its scene')
+        return self.index
 
     @property
-    def position(self): return self._position
+    def position(self):
+        self.row  # Raises if the object has been removed
+        return self._position
     @property
-    def scale(self): return self._scale
+    def scale(self):
+        self.row
+        return self._scale
     @property
-    def rotation(self): return self._rotation
+    def rotation(self):
+        self.row
+        return self._rotation
     @property
     def x(self): return self.position.x
     @property
     def y(self): return self.position.y
     @property
     def z(self): return self.position.z
+    @property
+    def vbo(self): return self.pool.vbo_keys[self.pool.vbos[self.row]]
+    @property
+    def texture(self): return tuple(self.pool.textures[self.row].tolist())
+    @property
+    def chunk(self): return tuple(self.pool.chunks[self.row].tolist())
+    @property
+    def dynamic(self): return bool(self.pool.dynamic[self.row])
 
     @position.setter
     def position(self, value):
-        self._position = value
-        self.update_position()
+        row = self.row
+        self.pool.positions[row] = tuple(value)
+        self.pool.dirty[row] = True
     @scale.setter
     def scale(self, value):
-        self._scale = value
-        self.update_scale()
+        row = self.row
+        self.pool.scales[row] = tuple(value)
+        self.pool.dirty[row] = True
     @rotation.setter
     def rotation(self, value):
-        self._rotation = value
-        self.update_rotation()
+        row = self.row
+        self.pool.rotations[row] = tuple(value)
+        self.pool.dirty[row] = True
     @x.setter
     def x(self, value): self.position.x = value
     @y.setter
     def y(self, value): self.position.y = value
     @z.setter
     def z(self, value): self.position.z = value
-    
-
-    def update_position(self):
-        self.chunk = (self.x // CHUNK_SIZE, self.y // CHUNK_SIZE, self.z // CHUNK_SIZE)
-
-        if abs(self.prev_position[0] - self.position[0]) < 0.001 and abs(self.prev_position[1] - self.position[1]) < 0.001 and abs(self.prev_position[2] - self.position[2]) < 0.001: return False   
-
-        if self.prev_chunk != self.chunk:
-            if self.chunk not in self.handler.chunks:
-                self.handler.chunks[self.chunk] = []
-            
-            self.handler.chunks[self.chunk].append(self)
-            self.handler.chunks[self.prev_chunk].remove(self)
-
-        self.handler.updated_chunks.add(self.prev_chunk)
-        self.handler.updated_chunks.add(self.chunk)
-
-        self.prev_chunk = self.chunk
-        self.prev_position = self.position[:]
-
-    def update_scale(self):
-        if abs(self.prev_scale[0] - self.scale.x) < 0.001 and abs(self.prev_scale[1] - self.scale.y) < 0.001 and abs(self.prev_scale[2] - self.scale.z) < 0.001: return False  
-        
-        self.handler.updated_chunks.add(self.chunk)
-
-        self.prev_scale = self.scale[:]
-
-    def update_rotation(self):
-        if abs(self.prev_rotation[0] - self.rotation.x) < 0.001 and abs(self.prev_rotation[1] - self.rotation.y) < 0.001 and abs(self.prev_rotation[2] - self.rotation.z) < 0.001: return False  
-        
-        self.handler.updated_chunks.add(self.chunk)
-
-        self.prev_rotation = self.rotation[:]
+    @vbo.setter
+    def vbo(self, value):
+        self.row
+        self.handler.set_vbo([self], value)
+    @texture.setter
+    def texture(self, value):
+        self.pool.textures[self.row] = value
+        self.handler.updated_objects.add(self)
+    @dynamic.setter
+    def dynamic(self, value):
+        self.row
+        self.handler.set_dynamic([self], value)
+
+    def get_radius(self) -> float:
+        """
+        Returns the radius of the object's bounding sphere
+        """
+
+        return self.handler.vbos[self.vbo].radius * float(np.max(np.abs(self.pool.scales[self.row])))
 
     def __repr__(self) -> str:
+        if self.index is None: return '<Object: removed>'
         return f'<Object: {self.position[0]},{self.position[1]},{self.position[2]}>'
\ No newline at end of file
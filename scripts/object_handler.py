@@ -1,136 +1,590 @@
 import numpy as np
 from scripts.object import Object
+from scripts.object_pool import ObjectPool
+from scripts.generic.math_functions import get_model_matrices
+from scripts.loose_octree import LooseOctree, CHUNK_SIZE
+from scripts.render.batches import InstanceBatch, MeshBatch, StreamBatch, VoxelBatch
+from scripts.render.voxel_mesher import VoxelMesher
+from scripts.render.chunk_builder import ChunkBuilder
 
-CHUNK_SIZE = 40
+
+VOXEL_KEY = 'voxels'  # Batch key of the greedy meshed cubes in a chunk
 
 
 class ObjectHandler:
-    def __init__(self, scene) -> None:
+    def __init__(self, scene, instanced: bool=True, matrices: bool=True, workers: int=4, cube_meshing: bool=False) -> None:
         # Reference to the scene hadlers and variables
         self.scene =       scene
         self.ctx   =       scene.ctx
         self.vbos  =       scene.vao_handler.vbo_handler.vbos
         self.program =     scene.vao_handler.shader_handler.programs['batch']
-        self.texture_ids = scene.project.texture_handler.texture_ids
+        self.texture_handler = scene.project.texture_handler
+        self.texture_ids = self.texture_handler.texture_ids
 
         self.view_distance = 4  # In chunks
+        self.lod_distance = 16  # Distance in bounding radii past which the first simplified level of detail is drawn. Each further level starts at twice the distance
+        self.lod_hysteresis = 0.2  # Fraction of a level the distance has to move past a level's range before the level changes
+        self.instanced = instanced  # Draw one shared model VBO per instance instead of duplicating vertices into the batch
+        self.matrices  = matrices   # Upload precomputed model and normal matrices per instance instead of position, rotation and scale
+        self.cube_meshing = cube_meshing  # Mesh axis aligned grid cubes with hidden face removal and greedy merging. Only used with combined meshes
+        if cube_meshing and instanced: raise ValueError('cube_meshing needs combined meshes, pass instanced=False to use it')
+
+        self.pool    = ObjectPool()  # Arrays containing the data of all objects
+        self.objects = self.pool.objects  # List containig all objects
+        self.chunks  = {}  # Contain sets with objects positioned in a bounding box in space (Spatial partitioning)
+        self.tree    = LooseOctree()  # Hierarchy of the chunks used for culling and spatial queries
+        self.batches = {}  # Contains dicts of the chunk's instance batches or mesh batch
+        self.builder = ChunkBuilder(self, workers)  # Builds the data of updated chunks on worker threads
+        self.streams = {}  # Contains the per frame instance batches of the dynamic objects keyed by (vbo, level of detail)
+        self.chunk_textures = {}  # Contains the unique texture ids of each chunk's objects. Only kept when the texture handler has a budget
+
+        # Free-list so spawn and despawn churn reuses GPU buffers instead of allocating new ones
+        self.free_batches    = {}  # Contains lists of emptied batches keyed by batch key
+        self.max_free_batches = 64  # Per batch key. Emptied batches past this are released
+
+        self.culled_chunks = 0  # Number of chunks culled on the last render
+        self.culled_dynamic = 0  # Number of dynamic objects culled on the last render
+
+        self.updated_chunks  = set()  # Chunks that have gained or lost objects since the last frame
+        self.updated_objects = set()  # Objects that need to have their buffer range rewritten on the next frame
+
+        # Layouts of the per instance data and the combined mesh data
+        if self.matrices:
+            self.instance_program = scene.vao_handler.shader_handler.programs['instance']
+            self.instance_format, self.instance_attribs, self.instance_row_size = '16f 9f 2f', ['obj_model', 'obj_normal', 'obj_texture'], 27
+        else:
+            self.instance_program = self.program
+            self.instance_format, self.instance_attribs, self.instance_row_size = '3f 3f 3f 2f', ['obj_position', 'obj_rotation', 'obj_scale', 'obj_texture'], 11
+        self.mesh_format, self.mesh_attribs, self.mesh_row_size = '3f 2f 3f 3f 3f 3f 2f', ['in_position', 'in_uv', 'in_normal', 'obj_position', 'obj_rotation', 'obj_scale', 'obj_texture'], 19
+        if self.cube_meshing: self.voxel_mesher = VoxelMesher(self.vbos['cube'], self.mesh_row_size)
+
+    def render(self) -> None:
+        """
+        Renders all the chunk batches inside the camera's view frustum, then streams and renders the dynamic objects in view
+        """
 
-        self.objects = []  # List containig all objects
-        self.chunks  = {}  # Contain lists with objects positioned in a bounding box in space (Spatial partitioning)
-        self.batches = {}  # Contains VBOs for the chunk meshes
+        visible, self.culled_chunks = self.get_visible_chunks()
+        if self.instanced: self.select_chunk_lods(visible)
+        dynamic = self.stream_dynamic()
 
-        self.updated_chunks = set()  # Chunks that need to have their mesh updated on the next frame
+        # Stream in the textures in view before drawing if not all textures fit in GPU memory
+        if self.texture_handler.budget is not None: self.texture_handler.use_textures(self.get_textures(visible, dynamic))
 
-    def render(self) -> None:
+        for chunk in visible:
+            for batch in self.batches[chunk].values():
+                batch.render()
+
+        for batch in self.streams.values():
+            batch.render()
+
+    def get_textures(self, chunks: list, dynamic: np.ndarray) -> np.ndarray:
+        """
+        Returns the unique (array, layer) texture ids used by the objects in the given chunks and by the given dynamic objects
+        """
+
+        textures = [self.pool.textures[dynamic]]
+        for chunk in chunks:
+            if chunk not in self.chunk_textures:
+                objects = self.chunks.get(chunk, ())
+                indices = np.fromiter((object.index for object in objects), dtype='i4', count=len(objects))
+                self.chunk_textures[chunk] = np.unique(self.pool.textures[indices], axis=0)
+            textures.append(self.chunk_textures[chunk])
+
+        return np.unique(np.concatenate(textures), axis=0)
+
+    def stream_dynamic(self) -> np.ndarray:
         """
-        Renders all the chunk batches in the camera's range
-        Includes some view culling, but not frustum culling. 
+        Rewrites the stream batches with the current data of the dynamic objects in view.
+        Dynamic objects are not kept in chunks, so their movement never causes a static chunk to be rebuilt.
+        Returns the pool indices of the dynamic objects in view.
         """
-        
-        # Gets a rectanglur prism of chunks in the cameras view
-        render_range_x, render_range_y, render_range_z = self.get_render_range()
 
-        # Loop through all chunks in view and render
-        for x in range(*render_range_x):
-            for y in range(*render_range_y):
-                for z in range(*render_range_z):
-                    chunk = (x, y, z)  # Key of the chunk
-                    
-                    if chunk not in self.batches: continue  # Dont render non-existent chunks
+        pool = self.pool
+        indices = np.flatnonzero(pool.dynamic[:pool.count])
+
+        # Cull the objects by their bounding spheres
+        visible = indices[self.get_view_test()(pool.positions[indices], self.get_radii(indices))] if len(indices) else indices
+        self.culled_dynamic = len(indices) - len(visible)
+
+        # Pick the level of detail of each object from its own distance to the camera
+        vbo_ids = pool.vbos[visible]
+        radii = self.get_radii(visible)
+        distances = np.maximum(np.linalg.norm(pool.positions[visible] - np.array(self.scene.camera.position, dtype='f4'), axis=1) - radii, 0)
+        lod_counts = np.array([len(self.vbos[key].lods) for key in pool.vbo_keys], dtype='i4')[vbo_ids]
+        pool.lods[visible] = self.get_lods(distances, radii, pool.lods[visible], lod_counts)
+
+        # Split the visible objects by model and level of detail
+        lods = pool.lods[visible]
+        order = np.lexsort((lods, vbo_ids))
+        visible, vbo_ids, lods = visible[order], vbo_ids[order], lods[order]
+        starts = np.flatnonzero(np.r_[True, (vbo_ids[1:] != vbo_ids[:-1]) | (lods[1:] != lods[:-1])]) if len(visible) else visible
+        ends = [*starts[1:].tolist(), len(visible)]
+
+        # The instance data of all visible objects is built at once
+        data = self.build_instance_data(pool.positions[visible], pool.rotations[visible], pool.scales[visible], pool.textures[visible], vbo_ids)
 
-                    self.batches[chunk][1].render()
+        streamed = set()
+        for start, end, vbo_id, lod in zip(starts.tolist(), ends, vbo_ids[starts].tolist(), lods[starts].tolist()):
+            key = (pool.vbo_keys[vbo_id], lod)
+            if key not in self.streams: self.streams[key] = StreamBatch(self, *key)
+            self.streams[key].stream(data[start:end])
+            streamed.add(key)
+
+        # Models and levels with no visible dynamic objects this frame draw nothing
+        for key, batch in self.streams.items():
+            if key not in streamed: batch.stream(data[:0])
+
+        return visible
+
+    def select_chunk_lods(self, visible: list) -> None:
+        """
+        Picks the level of detail of the instance batches in the visible chunks.
+        A batch's distance is measured to the nearest point of its chunk's loose bounds, so no object in the batch is closer to the camera.
+        """
+
+        chunks, batches = [], []
+        for chunk in visible:
+            for batch in self.batches[chunk].values():
+                if len(batch.vbo.lods) < 2: continue
+                chunks.append(chunk)
+                batches.append(batch)
+
+        if not batches: return
+
+        centers, half_sizes = self.tree.get_bounds(np.array(chunks, dtype='i4'))
+        distances = np.linalg.norm(np.maximum(np.abs(centers - np.array(self.scene.camera.position, dtype='f4')) - half_sizes[:,None], 0), axis=1)
+
+        radii = np.array([batch.radius for batch in batches], dtype='f4')
+        lods = np.array([batch.lod for batch in batches], dtype='i4')
+        lod_counts = np.array([len(batch.vbo.lods) for batch in batches], dtype='i4')
+        for batch, lod in zip(batches, self.get_lods(distances, radii, lods, lod_counts).tolist()): batch.lod = lod
+
+    def get_lods(self, distances: np.ndarray, radii: np.ndarray, lods: np.ndarray, lod_counts: np.ndarray) -> np.ndarray:
+        """
+        Returns the level of detail for bounding spheres at the given distances from the camera.
+        Level i is drawn from lod_distance * 2 ** (i - 1) radii away. The current level is kept until the distance is lod_hysteresis of a level past its range, so objects near a boundary do not flicker between levels.
+        Args:
+            lods: np.ndarray
+                Level each sphere is currently drawn with
+            lod_counts: np.ndarray
+                Number of levels of each sphere's model
+        """
+
+        # Continuous level where level i covers [i, i + 1)
+        with np.errstate(divide='ignore'):
+            levels = np.log2(distances / (np.maximum(radii, 1e-6) * self.lod_distance)) + 1
+
+        keep = (levels >= lods - self.lod_hysteresis) & (levels < lods + 1 + self.lod_hysteresis)
+        lods = np.where(keep, lods, np.floor(np.maximum(levels, 0)))
+        return np.clip(lods, 0, lod_counts - 1).astype('i4')
 
     def update(self) -> None:           
         """
-        Batches all the chunks that have been updated since the last frame. 
+        Updates the batches of all chunks and objects that have changed since the last frame. 
         """ 
-        # Loop through the set of updated chunk keys and batch the chunk
-        for chunk in self.updated_chunks:
-            self.batch_chunk(chunk)
+        # Resolve all writes to object data since the last frame
+        self.resolve_dirty()
+
+        # Voxel meshes are shared between cubes, so a changed object rebuilds its chunk instead of rewriting its own range
+        if self.cube_meshing: self.updated_chunks.update(object.chunk for object in self.updated_objects if not object.dynamic)
 
-        # Clears the set of updated chunks so that they are batched unless they are updated again
+        # Start building the updated chunks on the worker threads and upload the builds that are done
+        self.builder.submit(self.updated_chunks)
+        self.builder.upload()
+
+        # Rewrite only the buffer ranges of objects that changed
+        self.write_objects(self.updated_objects)
+
+        # Chunks whose objects or textures changed find their texture ids again on the next render
+        if self.chunk_textures:
+            for chunk in self.updated_chunks: self.chunk_textures.pop(chunk, None)
+            for object in self.updated_objects: self.chunk_textures.pop(object.chunk, None)
+
+        # Clears the sets of updates so that they are batched unless they are updated again
         self.updated_chunks.clear()
+        self.updated_objects.clear()
 
-    def batch_chunk(self, chunk_key: tuple) -> None:
+    def resolve_dirty(self) -> None:
         """
-        Combines all the verticies of the chunk's objects into a single VBO.
-        This mesh can render the whole chunk in just on render call.
-        Args:
-            chunk_key: tuple = (x, y, z)
-                The position of the chunk. Used as the key in the chunks and batches dicts
+        Resolves the objects marked in the pool's dirty mask in bulk.
+        Objects that changed more than the threshold are moved to their new chunks and queued to have their buffer ranges rewritten.
         """
-        
-        # Get the chunks from key
-        if chunk_key not in self.chunks: return
-        chunk = self.chunks[chunk_key]
 
-        # Empty list to contain all vertex data of objects in the chunk
-        batch_data = []
+        pool = self.pool
+        dirty = np.flatnonzero(pool.dirty[:pool.count])
+        if not len(dirty): return
+        pool.dirty[dirty] = False
+
+        # Dynamic objects are streamed every frame so they have nothing to resolve
+        dirty = dirty[~pool.dynamic[dirty]]
 
-        # Loop through each object in the chunk, adding the object's mesh to batch_data
-        for object in chunk:
-            # Get all needed information from the vbo and the object
-            vertex_data = np.copy(self.vbos[object.vbo].vertex_data)
-            model_data = np.array([*object.position, *object.rotation, *object.scale, *object.texture])
+        # Find which attributes changed by more than the threshold
+        moved   = np.any(np.abs(pool.positions[dirty] - pool.prev_positions[dirty]) >= 0.001, axis=1)
+        scaled  = np.any(np.abs(pool.scales[dirty]    - pool.prev_scales[dirty])    >= 0.001, axis=1)
+        rotated = np.any(np.abs(pool.rotations[dirty] - pool.prev_rotations[dirty]) >= 0.001, axis=1)
 
-            # Create an empty array to hold the object's mesh data
-            object_data = np.zeros(shape=(vertex_data.shape[0], 19), dtype='f4')
+        pool.prev_positions[dirty[moved]]   = pool.positions[dirty[moved]]
+        pool.prev_scales[dirty[scaled]]     = pool.scales[dirty[scaled]]
+        pool.prev_rotations[dirty[rotated]] = pool.rotations[dirty[rotated]]
 
-            # Add the vbo and object information to the mesh
-            object_data[:,:8] = vertex_data
-            object_data[:,8:] = model_data
+        # Only a change in position or scale can move an object to another chunk
+        resized = dirty[moved | scaled]
+        if len(resized):
+            keys = self.tree.get_chunks(pool.positions[resized], self.get_radii(resized))
 
-            # Store the mesh
-            batch_data.append(object_data)
+            # Move the objects that changed chunk
+            migrated = np.flatnonzero(np.any(keys != pool.chunks[resized], axis=1))
+            for i in migrated:
+                object = pool.objects[resized[i]]
+                prev_chunk, chunk = object.chunk, tuple(keys[i].tolist())
 
-        # Combine all meshes into a single array
-        if len(batch_data) > 1: batch_data = np.vstack(batch_data)
-        else: batch_data = np.array(batch_data, dtype='f4')
+                if chunk not in self.chunks: self.chunks[chunk] = set()
+                self.chunks[chunk].add(object)
+                self.chunks[prev_chunk].discard(object)
 
-        # If there are no verticies, delete the chunk
-        if len(batch_data) == 0:
-            if chunk_key in self.batches: del self.batches[chunk_key]
+                self.updated_chunks.add(prev_chunk)
+                self.updated_chunks.add(chunk)
+
+            pool.chunks[resized] = keys
+
+        self.updated_objects.update(pool.objects[i] for i in dirty[moved | scaled | rotated])
+
+    def flush(self) -> None:
+        """
+        Waits for all pending chunk builds and uploads them. Used when the batches need to be complete on the next render.
+        """
+
+        self.builder.upload(flush=True)
+
+    def apply_job(self, job) -> int:
+        """
+        Applies a finished chunk build to the chunk's batches. Called on the render thread.
+        Objects that left the chunk free their slot and new objects are given one. Objects that stayed are not rewritten.
+        Returns the number of bytes uploaded.
+        Args:
+            job: ChunkJob
+                The changes of the chunk with the built data of its added objects
+        """
+
+        chunk_key = job.chunk
+        if chunk_key not in self.batches:
+            self.batches[chunk_key] = {}
+            self.tree.insert(chunk_key)
+        batches = self.batches[chunk_key]
+
+        # Remove objects that are no longer in the chunk
+        for key, removed in job.removed.items():
+            if key not in job.groups:
+                self.free_batch(key, batches.pop(key))
+                continue
+
+            batches[key].remove(removed)
+
+        # Add objects that are new to the chunk with their built data
+        uploaded = 0
+        for key, data in job.data.items():
+            if key not in batches: batches[key] = self.get_batch(key)
+            added = job.added[key]
+
+            batches[key].add(added, data)
+            uploaded += data.nbytes if isinstance(data, np.ndarray) else data[1].nbytes
+
+        # The latest job of a chunk is the one applied, so its rebatched objects are done
+        if self.builder.rebatched:
+            for added in job.added.values(): self.builder.rebatched.difference_update(added)
+
+        # If there are no objects, delete the chunk
+        if not batches:
+            del self.batches[chunk_key]
+            self.tree.remove(chunk_key)
             if chunk_key in self.chunks: del self.chunks[chunk_key]
+            return uploaded
+
+        # Rewrite the added objects that changed while they were being built
+        if job.stale: self.write_objects(job.stale)
+
+        return uploaded
+
+    def write_objects(self, objects: set) -> None:
+        """
+        Rewrites the buffer ranges of the given objects in their batches
+        """
+
+        # Group the objects by the batch they are in
+        batched = {}
+        for object in objects:
+            if object.dynamic: continue
+
+            # A pending build may add the object again with the rows it gathered before this change, such as a rebatched object or a rebuilt batch
+            self.builder.mark_stale(object)
+
+            batch = self.batches.get(object.chunk, {}).get(self.get_batch_key(object))
+            if batch is None or object not in batch: continue
+            if batch not in batched: batched[batch] = []
+            batched[batch].append(object)
+
+        if not batched: return
+
+        if not self.instanced:
+            for batch, objects in batched.items():
+                batch.write(objects)
+            return
+
+        # Instance data of every changed object is computed in one vectorized call and then split between the batches
+        data = self.get_instance_data([object for objects in batched.values() for object in objects])
+        start = 0
+        for batch, objects in batched.items():
+            batch.write(objects, data[start:start + len(objects)])
+            start += len(objects)
+
+    def get_batch_key(self, object: Object) -> str:
+        """
+        Returns the key of the batch the object is rendered in within its chunk
+        """
+
+        if self.instanced: return object.vbo
+        if self.get_voxel_mask(np.array([object.index]))[0]: return VOXEL_KEY
+        return None
+
+    def get_voxel_mask(self, indices: np.ndarray) -> np.ndarray:
+        """
+        Returns a bool mask of the objects at the pool indices that are meshed as voxels.
+        These are unrotated cubes with a uniform scale s on a grid with a spacing of 2s.
+        """
+
+        pool = self.pool
+        if not self.cube_meshing or 'cube' not in pool.vbo_ids: return np.zeros(shape=len(indices), dtype=bool)
+
+        scales = pool.scales[indices]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cells = pool.positions[indices] / (2 * scales[:,:1])
+
+        return ((pool.vbos[indices] == pool.vbo_ids['cube']) & (scales[:,0] > 0)
+                & np.all(np.abs(pool.rotations[indices]) < 1e-4, axis=1)
+                & np.all(np.abs(scales - scales[:,:1]) < 1e-4, axis=1)
+                & np.all(np.abs(cells - np.round(cells)) < 1e-3, axis=1))
+
+    def get_batch_groups(self, chunks: list) -> list:
+        """
+        Groups the objects of many chunks by the key of the batch they are rendered in, with one sort over all chunks.
+        Returns a list with a dict of batch key -> set of objects for each chunk.
+        Args:
+            chunks: list
+                Lists of the objects in each chunk
+        """
+
+        if not self.instanced and not self.cube_meshing: return [{None: set(objects)} if objects else {} for objects in chunks]
+
+        objects = [object for chunk in chunks for object in chunk]
+        groups = [{} for chunk in chunks]
+        if not objects: return groups
+
+        # Ids of the batch of each object. Instance batches are split by vbo and mesh batches by whether the object is a voxel
+        indices = np.fromiter((object.index for object in objects), dtype='i4', count=len(objects))
+        if self.instanced:
+            batch_ids, batch_keys = self.pool.vbos[indices], self.pool.vbo_keys
+        else:
+            batch_ids, batch_keys = self.get_voxel_mask(indices).astype('i4'), [None, VOXEL_KEY]
+
+        # Sort the objects by chunk and batch id and split them into runs of the same pair
+        chunk_ids = np.repeat(np.arange(len(chunks)), [len(chunk) for chunk in chunks])
+        order = np.lexsort((batch_ids, chunk_ids))
+        batch_ids, chunk_ids = batch_ids[order], chunk_ids[order]
+        starts = np.flatnonzero(np.r_[True, (batch_ids[1:] != batch_ids[:-1]) | (chunk_ids[1:] != chunk_ids[:-1])])
+        ends = [*starts[1:].tolist(), len(objects)]
+
+        order = order.tolist()
+        for start, end in zip(starts.tolist(), ends):
+            groups[chunk_ids[start]][batch_keys[batch_ids[start]]] = {objects[i] for i in order[start:end]}
+
+        return groups
+
+    def get_batch(self, key: str):
+        """
+        Returns an empty batch for a chunk. Batches freed by emptied chunks are reused before creating a new one.
+        """
+
+        free = self.free_batches.get(key)
+        if free: return free.pop()
+
+        if self.instanced: return InstanceBatch(self, key)
+        if key == VOXEL_KEY: return VoxelBatch(self)
+        return MeshBatch(self)
+
+    def free_batch(self, key: str, batch) -> None:
+        """
+        Empties a batch and keeps it for reuse by another chunk, releasing it if enough batches with the key are already kept
+        """
+
+        if key not in self.free_batches: self.free_batches[key] = []
+        free = self.free_batches[key]
+
+        if len(free) >= self.max_free_batches:
+            batch.release()
             return
 
-        # Release any existing vbo and vaos for the chunk
-        if chunk_key in self.batches:
-            self.batches[chunk_key][0].release()
-            self.batches[chunk_key][1].release()
+        batch.clear()
+        free.append(batch)
+
+    def get_rows(self, objects: list) -> tuple:
+        """
+        Returns copies of the pool rows of the given objects as (positions, rotations, scales, textures, vbo ids).
+        The copies are safe to build from on a worker thread while the pool keeps changing.
+        """
+
+        indices = np.fromiter((object.index for object in objects), dtype='i4', count=len(objects))
+        pool = self.pool
+        return pool.positions[indices], pool.rotations[indices], pool.scales[indices], pool.textures[indices], pool.vbos[indices]
+
+    def get_instance_data(self, objects: list) -> np.ndarray:
+        """
+        Returns the per instance rows of the given objects.
+        Rows are (model matrix, normal matrix, texture) if matrices is enabled, otherwise (position, rotation, scale, texture).
+        """
+
+        return self.build_instance_data(*self.get_rows(objects))
+
+    def build_instance_data(self, positions: np.ndarray, rotations: np.ndarray, scales: np.ndarray, textures: np.ndarray, vbo_ids: np.ndarray) -> np.ndarray:
+        """
+        Builds the per instance rows from gathered object rows. Does not touch the pool so it can run on a worker thread.
+        """
 
-        # Create the vbo and the vao from mesh data
-        vbo = self.ctx.buffer(batch_data)
-        vao = self.ctx.vertex_array(self.program, [(vbo, '3f 2f 3f 3f 3f 3f 2f', *['in_position', 'in_uv', 'in_normal', 'obj_position', 'obj_rotation', 'obj_scale', 'obj_texture'])], skip_errors=True)
+        if not self.matrices: return np.hstack([positions, rotations, scales, textures], dtype='f4')
 
-        # Store batched chunk mesh in the batches dict
-        self.batches[chunk_key] = (vbo, vao)
+        # Model and normal matrices of all objects at once
+        model, normal = get_model_matrices(positions, rotations, scales)
+        return np.hstack([model, normal, textures], dtype='f4')
 
-    def get_render_range(self) -> tuple:
+    def build_batch_data(self, key: str, *rows) -> np.ndarray:
         """
-        Returns a rectangluar prism of chunks that are in the camera's view.
-        Tuple return is in form ((x1, x2), (y1, y2), (z1, z2))
+        Builds the data of the objects added to a batch from their gathered rows. Does not touch the pool so it can run on a worker thread.
         """
-        
-        cam_position = self.scene.camera.position  # glm.vec3(x, y, z)
-        fov = 40  # The range in which a direction will not be culled
 
-        # Default to a cube of chunks around the camera extending view_distance chunks in each direction
-        render_range_x = [int(cam_position.x // CHUNK_SIZE - self.view_distance), int(cam_position.x // CHUNK_SIZE + self.view_distance + 1)]
-        render_range_y = [int(cam_position.y // CHUNK_SIZE - self.view_distance), int(cam_position.y // CHUNK_SIZE + self.view_distance + 1)]
-        render_range_z = [int(cam_position.z // CHUNK_SIZE - self.view_distance), int(cam_position.z // CHUNK_SIZE + self.view_distance + 1)]
+        if self.instanced: return self.build_instance_data(*rows)
+        if key == VOXEL_KEY: return self.build_voxel_data(*rows)
+        return self.build_mesh_data(*rows)
 
-        # Remove chunks that the play is facing away from
-        render_range_x[1] -= self.view_distance * (180 - fov < self.scene.camera.yaw < 180 + fov) - 1
-        render_range_x[0] += self.view_distance * (-fov < self.scene.camera.yaw < fov or self.scene.camera.yaw > 360 - fov) - 1
+    def build_voxel_data(self, positions: np.ndarray, rotations: np.ndarray, scales: np.ndarray, textures: np.ndarray, vbo_ids: np.ndarray) -> np.ndarray:
+        """
+        Builds the greedy merged mesh of the visible faces of voxel cubes from their gathered rows
+        """
 
-        render_range_y[0] += self.view_distance * (self.scene.camera.pitch > 25) - 1
-        render_range_y[1] -= self.view_distance * (self.scene.camera.pitch < -25) - 1
+        return self.voxel_mesher.build(positions, scales[:,0], textures)
 
-        render_range_z[1] -= self.view_distance * (270 - fov < self.scene.camera.yaw < 270 + fov) - 1
-        render_range_z[0] += self.view_distance * (90 - fov < self.scene.camera.yaw < 90 + fov) - 1
+    def get_meshes_data(self, objects: list) -> tuple:
+        """
+        Builds the combined mesh data of many objects into one preallocated array.
+        Returns a tuple of (list of the objects in the order of their meshes, mesh array, vertex count of each object)
+        """
 
+        order, object_data, counts = self.build_mesh_data(*self.get_rows(objects))
+        return [objects[i] for i in order.tolist()], object_data, counts
 
-        return (render_range_x, render_range_y, render_range_z)
+    def build_mesh_data(self, positions: np.ndarray, rotations: np.ndarray, scales: np.ndarray, textures: np.ndarray, vbo_ids: np.ndarray) -> tuple:
+        """
+        Builds the combined mesh data from gathered object rows. Does not touch the pool so it can run on a worker thread.
+        Objects are ordered by vbo so each model's vertices and its objects' model data are broadcast into one contiguous block at once.
+        Returns a tuple of (order of the objects' meshes as indices into the rows, mesh array, vertex count of each object)
+        """
+
+        # Order the objects so objects with the same model are next to each other
+        order = np.argsort(vbo_ids, kind='stable')
+        vbo_ids, group_sizes = np.unique(vbo_ids[order], return_counts=True)
+
+        # Vertex count of each object's mesh
+        vertex_data = [self.vbos[self.pool.vbo_keys[vbo_id]].vertex_data for vbo_id in vbo_ids.tolist()]
+        vertex_counts = np.array([len(vertices) for vertices in vertex_data], dtype='i4')
+        counts = np.repeat(vertex_counts, group_sizes)
+
+        # Create an empty array to hold the mesh data of all objects
+        object_data = np.empty(shape=(int(counts.sum()), self.mesh_row_size), dtype='f4')
+        model_data = np.hstack([positions[order], rotations[order], scales[order], textures[order]], dtype='f4')
+
+        # Broadcast the model's vertices and each object's model data over the block of each vbo
+        start, first = 0, 0
+        for vertices, size, vertex_count in zip(vertex_data, group_sizes.tolist(), vertex_counts.tolist()):
+            block = object_data[start:start + size * vertex_count].reshape(size, vertex_count, self.mesh_row_size)
+            block[:,:,:8] = vertices
+            block[:,:,8:] = model_data[first:first + size,None]
+            start += size * vertex_count
+            first += size
+
+        return order, object_data, counts
+
+    def get_visible_chunks(self) -> tuple:
+        """
+        Walks the chunk tree, testing the loose bounds of each level against the camera's frustum planes in one vectorized pass.
+        Nodes further than view_distance chunks from the camera on any axis are also culled.
+        Returns a tuple of (list of visible chunk keys, number of culled chunks)
+        """
+
+        if not self.batches: return [], 0
+
+        visible = self.tree.traverse(self.get_view_test())
+        return visible, len(self.batches) - len(visible)
+
+    def get_view_test(self):
+        """
+        Returns a vectorized test of boxes against the camera's frustum planes and view distance.
+        The test takes (n, 3) box centers and (n,) half sizes and returns a bool mask of the boxes in view.
+        """
+
+        camera = self.scene.camera
+        planes = camera.frustum_planes
+        cam_position = np.array(camera.position, dtype='f4')
+        max_distance = self.view_distance * CHUNK_SIZE
+
+        def in_view(centers, half_sizes):
+            # Signed distance of each center to each plane, and the projected radius of the box onto each plane normal
+            distances = centers @ planes[:,:3].T + planes[:,3]
+            radii = half_sizes[:,None] * np.abs(planes[:,:3]).sum(axis=1)
+
+            # A node is visible if it is not fully behind any plane and is in view distance
+            in_frustum = np.all(distances >= -radii, axis=1)
+            in_range = np.all(np.abs(centers - cam_position) - half_sizes[:,None] <= max_distance, axis=1)
+            return in_frustum & in_range
+
+        return in_view
+
+    def get_radii(self, indices: np.ndarray) -> np.ndarray:
+        """
+        Returns the bounding sphere radii of the objects at the given pool indices
+        """
+
+        radii = np.array([self.vbos[vbo].radius for vbo in self.pool.vbo_keys], dtype='f4')[self.pool.vbos[indices]]
+        return radii * np.max(np.abs(self.pool.scales[indices]), axis=1)
+
+    def query(self, bottom_left: tuple, top_right: tuple) -> list:
+        """
+        Returns all objects whose bounds overlap the given axis aligned box
+        Args:
+            bottom_left: tuple=(x, y, z)
+                Minimum corner of the box
+            top_right: tuple=(x, y, z)
+                Maximum corner of the box
+        """
+
+        bottom_left, top_right = np.array(bottom_left, dtype='f4'), np.array(top_right, dtype='f4')
+        box_center, box_half = (bottom_left + top_right) / 2, (top_right - bottom_left) / 2
+
+        def overlaps(centers, half_sizes):
+            return np.all(np.abs(centers - box_center) <= half_sizes[:,None] + box_half, axis=1)
+
+        # Test each object in the overlapping chunks against the box using its bounding sphere
+        found = []
+        for chunk in self.tree.traverse(overlaps):
+            for object in self.chunks[chunk]:
+                position = self.pool.positions[object.index]
+                closest = np.clip(position, bottom_left, top_right)
+                if np.sum((closest - position) ** 2) <= object.get_radius() ** 2: found.append(object)
+
+        # Dynamic objects are not in the chunks so they are all tested at once
+        dynamic = np.flatnonzero(self.pool.dynamic[:self.pool.count])
+        positions = self.pool.positions[dynamic]
+        distances = np.sum((np.clip(positions, bottom_left, top_right) - positions) ** 2, axis=1)
+        found.extend(self.pool.objects[i] for i in dynamic[distances <= self.get_radii(dynamic) ** 2].tolist())
+
+        return found
 
     def add(self, vbo: str="cube", texture: str="box", position: tuple=(0, 0, 0), rotation: tuple=(0, 0, 0), scale: tuple=(1, 1, 1)) -> Object:
         """
@@ -149,32 +603,140 @@ class ObjectHandler:
                 The length of the object in each direction
         """
 
-        # The key of the chunk the object will be added to
-        chunk = (position[0] // CHUNK_SIZE, position[1] // CHUNK_SIZE, position[2] // CHUNK_SIZE)
+        return self.add_many(vbo, texture, [tuple(position)], rotation, scale)[0]
+
+    def add_many(self, vbo: str="cube", texture: str="box", positions: np.ndarray=None, rotations: np.ndarray=None, scales: np.ndarray=None) -> list:
+        """
+        Adds many objects with the same model and texture to the scene in one vectorized operation.
+        Each affected chunk is only marked once. Returns a list of the object instances.
+        Args:
+            vbo: str="cube":
+                The key of the vbo that the objects will have
+            texture: str="box":
+                Name of the objects texture
+            positions: np.ndarray
+                (n, 3) array of initial positions. The number of positions is the number of objects added.
+            rotations: np.ndarray
+                (n, 3) array of rotations, or a single rotation used for every object. Defaults to no rotation.
+            scales: np.ndarray
+                (n, 3) array of scales, or a single scale used for every object. Defaults to 1 on each axis.
+        """
+
+        positions = np.array(positions, dtype='f4').reshape(-1, 3)
+        n = len(positions)
+        if not n: return []
+        rotations = np.broadcast_to(np.array(rotations if rotations is not None else (0, 0, 0), dtype='f4'), (n, 3))
+        scales    = np.broadcast_to(np.array(scales    if scales    is not None else (1, 1, 1), dtype='f4'), (n, 3))
+
+        # Store the object data in the pool. Removed objects are never reused, so old references to them can't alias new objects
+        start = self.pool.count
+        objects = [Object(self, index) for index in range(start, start + n)]
+        self.pool.add_many(objects, vbo, self.texture_ids[texture], positions, rotations, scales)
+
+        # The keys of the chunks the objects will be added to
+        radii = self.vbos[vbo].radius * np.max(np.abs(scales), axis=1)
+        self.add_to_chunks(objects, self.tree.get_chunks(positions, radii))
+
+        return objects
+
+    def add_to_chunks(self, objects: list, keys: np.ndarray) -> None:
+        """
+        Adds objects to the chunk sets of the given (n, 4) chunk keys, marking each chunk once
+        """
+
+        indices = np.fromiter((object.index for object in objects), dtype='i4', count=len(objects))
+        self.pool.chunks[indices] = keys
 
-        # Create empty list if the chunk does not already exist
-        if chunk not in self.chunks:
-            self.chunks[chunk] = []
+        chunks, inverse, counts = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+        groups = np.split(np.argsort(inverse.reshape(-1), kind='stable'), np.cumsum(counts)[:-1])
+        for chunk, group in zip(map(tuple, chunks.tolist()), groups):
+            if chunk not in self.chunks: self.chunks[chunk] = set()
+            self.chunks[chunk].update(objects[j] for j in group.tolist())
+            self.updated_chunks.add(chunk)
+
+    def set_dynamic(self, objects: list, dynamic: bool) -> None:
+        """
+        Moves objects between the static chunk batches and the dynamic streamed layer.
+        Objects driven by physics should be dynamic so their movement does not rebuild the chunks of static objects around them.
+        """
 
-        # Create a new object from the given parameters
-        new_object = Object(self, vbo, self.texture_ids[texture], position, rotation, scale)
+        objects = [object for object in objects if object.index is not None and object.dynamic != dynamic]
+        if not objects: return
 
-        # Add the object to the objects list and to its correct chunk list
-        self.objects.append(new_object)
-        self.chunks[chunk].append(new_object)
-        self.updated_chunks.add(chunk)
+        pool = self.pool
+        indices = np.fromiter((object.index for object in objects), dtype='i4', count=len(objects))
+        pool.dynamic[indices] = dynamic
 
-        return new_object
+        if dynamic:
+            # Take the objects out of their chunks
+            for object, chunk in zip(objects, map(tuple, pool.chunks[indices].tolist())):
+                self.chunks[chunk].discard(object)
+                self.updated_chunks.add(chunk)
+            self.updated_objects.difference_update(objects)
+            return
+
+        # Put the objects back in the chunks at their current transform
+        pool.prev_positions[indices] = pool.positions[indices]
+        pool.prev_rotations[indices] = pool.rotations[indices]
+        pool.prev_scales[indices]    = pool.scales[indices]
+        self.add_to_chunks(objects, self.tree.get_chunks(pool.positions[indices], self.get_radii(indices)))
+
+    def set_vbo(self, objects: list, vbo: str) -> None:
+        """
+        Changes the model of objects.
+        Static objects are moved to the chunk that fits their new bounds and rebuilt in their batches, since a batch can hold the data of the old model.
+        """
+
+        objects = [object for object in objects if object.index is not None]
+        if not objects: return
+
+        pool = self.pool
+        indices = np.fromiter((object.index for object in objects), dtype='i4', count=len(objects))
+        pool.vbos[indices] = pool.get_vbo_id(vbo)
+
+        # Dynamic objects are streamed by model every frame so only static objects are moved
+        static = np.flatnonzero(~pool.dynamic[indices])
+        if not len(static): return
+        objects, indices = [objects[i] for i in static.tolist()], indices[static]
+
+        keys = self.tree.get_chunks(pool.positions[indices], self.get_radii(indices))
+        for object, prev_chunk, chunk in zip(objects, map(tuple, pool.chunks[indices].tolist()), map(tuple, keys.tolist())):
+            self.chunks[prev_chunk].discard(object)
+            if chunk not in self.chunks: self.chunks[chunk] = set()
+            self.chunks[chunk].add(object)
+            self.updated_chunks.add(prev_chunk)
+            self.updated_chunks.add(chunk)
+        pool.chunks[indices] = keys
+
+        self.builder.rebatched.update(objects)
 
     def remove(self, object) -> None:
         """
         Removes an object from the scene
         """
 
-        chunk = object.chunk
-        self.objects.remove(object)
-        self.chunks[chunk].remove(object)
+        self.remove_many([object])
+
+    def remove_many(self, objects: list) -> None:
+        """
+        Removes many objects from the scene at once.
+        The pool fills the freed rows with rows from its end, and each affected chunk is only marked once.
+        Removed objects raise a ValueError when their data is accessed.
+        """
+
+        objects = [object for object in set(objects) if object.index is not None]
+        if not objects: return
+
+        # Take the static objects out of their chunks
+        indices = np.fromiter((object.index for object in objects), dtype='i4', count=len(objects))
+        for object, chunk, dynamic in zip(objects, map(tuple, self.pool.chunks[indices].tolist()), self.pool.dynamic[indices].tolist()):
+            if dynamic: continue
+            self.chunks[chunk].discard(object)
+            self.updated_chunks.add(chunk)
 
-        self.updated_chunks.add(chunk)
+        self.updated_objects.difference_update(objects)
+        self.builder.rebatched.difference_update(objects)
 
-        del object
\ No newline at end of file
+        # Free the rows in the pool
+        self.pool.remove_many(indices)
+        for object in objects: object.index = None
@@ -0,0 +1,122 @@
+import numpy as np
+
+
+class ObjectPool:
+    """
+    Structure of arrays store for the data of all objects in a scene.
+    Row i of every array belongs to objects[i]. Removed rows are filled with the last row so the arrays stay packed.
+    """
+
+    # Names of all the per object arrays
+    fields = ('positions', 'rotations', 'scales', 'prev_positions', 'prev_rotations', 'prev_scales', 'textures', 'vbos', 'chunks', 'dirty', 'dynamic', 'lods')
+
+    def __init__(self, capacity: int=1024) -> None:
+        self.capacity = capacity
+        self.count = 0
+
+        # Object views in the same order as the rows
+        self.objects = []
+
+        # Model data
+        self.positions = np.zeros(shape=(capacity, 3), dtype='f4')
+        self.rotations = np.zeros(shape=(capacity, 3), dtype='f4')
+        self.scales    = np.zeros(shape=(capacity, 3), dtype='f4')
+
+        # Model data at the last change, used for detecting attribute changes
+        self.prev_positions = np.zeros(shape=(capacity, 3), dtype='f4')
+        self.prev_rotations = np.zeros(shape=(capacity, 3), dtype='f4')
+        self.prev_scales    = np.zeros(shape=(capacity, 3), dtype='f4')
+
+        # Rendering specifications
+        self.textures = np.zeros(shape=(capacity, 2), dtype='i4')  # (texture array, layer)
+        self.vbos     = np.zeros(shape=(capacity,),   dtype='i4')  # Index into vbo_keys
+        self.chunks   = np.zeros(shape=(capacity, 4), dtype='i4')  # (x, y, z, level)
+
+        # Set when an object's model data is written. Cleared by the object handler after resolving the change
+        self.dirty = np.zeros(shape=(capacity,), dtype=bool)
+
+        # Set for objects driven by physics. These are streamed every frame instead of being stored in chunks
+        self.dynamic = np.zeros(shape=(capacity,), dtype=bool)
+
+        # Level of detail each dynamic object was last drawn with
+        self.lods = np.zeros(shape=(capacity,), dtype='i1')
+
+        # VBO keys are stored as ints in the arrays
+        self.vbo_keys = []
+        self.vbo_ids  = {}
+
+    def get_vbo_id(self, vbo: str) -> int:
+        """
+        Returns the int id of a vbo key, assigning a new one if the key has not been used before
+        """
+
+        if vbo not in self.vbo_ids:
+            self.vbo_ids[vbo] = len(self.vbo_keys)
+            self.vbo_keys.append(vbo)
+
+        return self.vbo_ids[vbo]
+
+    def add_many(self, objects: list, vbo: str, texture: tuple, positions: np.ndarray, rotations: np.ndarray, scales: np.ndarray) -> slice:
+        """
+        Stores the data of new objects in the next free rows. Returns the slice of the new rows.
+        Args:
+            objects: list
+                Object views for the new rows. Their indices should start at count.
+            positions, rotations, scales: np.ndarray
+                (n, 3) arrays of the model data
+        """
+
+        n = len(objects)
+        if self.count + n > self.capacity: self.grow(max(self.capacity * 2, self.count + n))
+
+        rows = slice(self.count, self.count + n)
+        self.count += n
+        self.objects.extend(objects)
+
+        self.positions[rows] = self.prev_positions[rows] = positions
+        self.rotations[rows] = self.prev_rotations[rows] = rotations
+        self.scales[rows]    = self.prev_scales[rows]    = scales
+        self.textures[rows]  = texture
+        self.vbos[rows]      = self.get_vbo_id(vbo)
+        self.dirty[rows]     = False
+        self.dynamic[rows]   = False
+        self.lods[rows]      = 0
+
+        return rows
+
+    def remove_many(self, indices: np.ndarray) -> None:
+        """
+        Removes the rows at the indices. Rows from the end of the arrays are moved into the holes so the arrays stay packed.
+        """
+
+        indices = np.unique(indices)
+        count = self.count - len(indices)
+
+        # Holes inside the kept range are filled by the kept rows from past the end of it
+        holes = indices[indices < count]
+        tail = np.setdiff1d(np.arange(count, self.count), indices, assume_unique=True)
+
+        if len(holes):
+            for field in self.fields:
+                array = getattr(self, field)
+                array[holes] = array[tail]
+
+            for hole, row in zip(holes.tolist(), tail.tolist()):
+                self.objects[hole] = self.objects[row]
+                self.objects[hole].index = hole
+
+        del self.objects[count:]
+        self.count = count
+
+    def grow(self, capacity: int) -> None:
+        """
+        Reallocates all arrays with the given capacity
+        """
+
+        for field in self.fields:
+            array = getattr(self, field)
+            new_array = np.zeros(shape=(capacity, *array.shape[1:]), dtype=array.dtype)
+            new_array[:self.count] = array[:self.count]
+            setattr(self, field, new_array)
+
+        self.capacity = capacity
@@ -1,6 +1,7 @@
 from scripts.scene import Scene
 from scripts.render.vao_handler import VAOHandler
 from scripts.render.texture_handler import TextureHandler
+from scripts.render.asset_bundle import open_bundle
 from scripts.physics.physics_handler import PhysicsHandler
 
 class Project:
@@ -11,12 +12,14 @@ class Project:
         # Stores the engine
         self.engine = engine
         self.ctx = engine.ctx
+        # Opens the baked assets if the project has been baked
+        self.bundle = open_bundle()
         # Creates physics engine
         self.physics_handler = PhysicsHandler(None)
         # Creates vao handler to be used by scenes
         self.vao_handler = VAOHandler(self)
         # Creates a texture handler
-        self.texture_handler = TextureHandler(self.engine, self.vao_handler)
+        self.texture_handler = TextureHandler(self.engine, self.vao_handler, bundle=self.bundle)
         # Creates scenes
         self.scenes = {0 : Scene(self.engine, self)}
         self.current_scene = self.scenes[0]
@@ -49,6 +52,8 @@ class Project:
 
     def release(self) -> None:
         """
-        Releases all scenes in project
+        Releases all scenes and textures in project, then closes the asset bundle
         """
-        [scene.release() for scene in self.scenes.values()]
\ No newline at end of file
+        [scene.release() for scene in self.scenes.values()]
+        self.texture_handler.release()
+        if self.bundle: self.bundle.close()
\ No newline at end of file
@@ -0,0 +1,200 @@
+import os
+import sys
+import mmap
+import json
+import struct
+import numpy as np
+
+
+MAGIC = b'BSLKBNDL'
+VERSION = 1
+BAKE_VERSION = 1  # Bumped when the way assets are baked changes so older bundles are treated as out of date
+ALIGNMENT = 64  # Byte alignment of every blob so arrays can be viewed in place
+HEADER = struct.Struct('<8sIQ')  # Magic, version and length of the JSON index
+
+
+class AssetBundle:
+    """
+    Single file holding the baked textures, models and shaders of a project.
+    The file is a header index followed by aligned binary blobs. It is memory mapped and assets are returned as zero copy views of the blobs.
+    Every entry records the size and modification time of its source file. If the source exists and has changed since the bake, the entry is skipped so the handlers load the file instead.
+    The index also records the settings the assets were baked with. Assets baked with other settings, such as other texture sizes, are all skipped.
+    """
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.file = open(path, 'rb')
+        self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.mmap)
+
+        magic, version, length = HEADER.unpack_from(self.mmap)
+        if magic != MAGIC or version != VERSION: raise ValueError(f'{path} is not a version {VERSION} asset bundle')
+        self.index = json.loads(bytes(self.view[HEADER.size:HEADER.size + length]))
+        self.data_start = align(HEADER.size + length)  # Blob offsets are relative to the data section after the index
+
+        # Kinds of assets baked with other settings than the current ones are out of date
+        settings, baked = get_settings(), self.index.get('settings', {})
+        if baked.get('bake') != settings['bake']: self.stale = {'textures', 'models', 'shaders'}
+        else: self.stale = {kind for kind in ('textures', 'models') if baked.get(kind) != settings[kind]}
+
+    def get_blob(self, blob: list):
+        """
+        Returns a zero copy view of a blob. Arrays are returned as read only NumPy arrays, other blobs as memoryviews.
+        """
+
+        offset, size, dtype, shape = blob
+        offset += self.data_start
+        data = self.view[offset:offset + size]
+        if dtype is None: return data
+        return np.frombuffer(data, dtype=dtype).reshape(shape)
+
+    def get_entry(self, kind: str, name: str, source: str) -> dict:
+        """
+        Returns the index entry of an asset, or None if the bundle has no entry, the entry's source file has changed or its kind was baked with other settings
+        """
+
+        if kind in self.stale: return None
+        entry = self.index[kind].get(name)
+        if entry is None: return None
+
+        if source and os.path.exists(source):
+            stat = os.stat(source)
+            if [stat.st_size, stat.st_mtime_ns] != entry['source']: return None
+
+        return entry
+
+    def names(self, kind: str) -> list:
+        """
+        Returns the names of the assets of a kind, 'textures', 'models' or 'shaders'. Out of date kinds have no names
+        """
+
+        if kind in self.stale: return []
+        return list(self.index[kind])
+
+    def get_texture(self, name: str, source: str=None) -> list:
+        """
+        Returns the mip chain of a texture file such as 'box.png', from its (size, size, 3) pre resized layer down to 1x1, or None if it is not in the bundle or is out of date
+        """
+
+        entry = self.get_entry('textures', name, source)
+        return [self.get_blob(blob) for blob in entry['blobs']] if entry else None
+
+    def get_model(self, name: str, source: str=None) -> dict:
+        """
+        Returns the data of a model in the layout given by get_model_data, or None if it is not in the bundle or is out of date
+        """
+
+        entry = self.get_entry('models', name, source)
+        if not entry: return None
+        return {**entry['meta'], **{key: self.get_blob(blob) for key, blob in entry['arrays'].items()}}
+
+    def get_shader(self, name: str, source: str=None) -> str:
+        """
+        Returns the source of a shader file such as 'default.vert', or None if it is not in the bundle or is out of date
+        """
+
+        entry = self.get_entry('shaders', name, source)
+        return str(self.get_blob(entry['blob']), 'utf-8') if entry else None
+
+    def close(self) -> None:
+        """
+        Closes the bundle's file and memory map. Should be called once the handlers that loaded from the bundle are released.
+        If arrays given out by the bundle are still referenced, the map can't be closed safely and is unmapped once they are freed.
+        """
+
+        self.file.close()
+        self.view.release()
+        try: self.mmap.close()
+        except BufferError: pass
+        self.view = self.mmap = None
+
+
+def open_bundle(path: str='assets.bundle') -> AssetBundle:
+    """
+    Opens the bundle at the path. Returns None if there is no bundle, in which case all assets are loaded from their files.
+    """
+
+    if not os.path.exists(path): return None
+    return AssetBundle(path)
+
+
+def get_settings() -> dict:
+    """
+    Returns the settings that baked assets depend on. Models use the mesh cache's version, which is bumped whenever the derived model data changes
+    """
+
+    from scripts.render.mesh_cache import MeshCache
+    from scripts.render.texture_cache import TextureCache
+    from scripts.render.texture_handler import TEXTURE_SIZES
+
+    return {'bake': BAKE_VERSION, 'models': MeshCache.version, 'textures': [TextureCache.version, list(TEXTURE_SIZES)]}
+
+
+def bake(path: str='assets.bundle', textures: str='textures', models: str='models', shaders: str='shaders') -> None:
+    """
+    Writes the assets of a project's directories into a bundle.
+    Textures are stored resized and flipped as they are uploaded with their mip chains, models with all of their derived data and shaders as their sources.
+    """
+
+    import pygame as pg
+    from scripts.render.texture_handler import get_texture_layer, get_mipmaps
+    from scripts.render.vbo_handler import get_model_data
+
+    blobs = []  # Arrays in file order
+    data_size = 0
+    def add_blob(data) -> list:
+        nonlocal data_size
+        if isinstance(data, bytes): array, dtype, shape = np.frombuffer(data, dtype='u1'), None, None
+        else: array = np.ascontiguousarray(data); dtype, shape = array.dtype.str, list(array.shape)
+
+        # Offsets are relative to the start of the data section, so they don't depend on the size of the header
+        offset = align(data_size)
+        data_size = offset + array.nbytes
+        blobs.append((offset, array))
+        return [offset, array.nbytes, dtype, shape]
+
+    def get_source(file: str) -> list:
+        stat = os.stat(file)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    index = {'settings': get_settings(), 'textures': {}, 'models': {}, 'shaders': {}}
+
+    for file in sorted(os.listdir(textures)):
+        source = os.path.join(textures, file)
+        if not os.path.isfile(source): continue
+        index['textures'][file] = {'source': get_source(source), 'blobs': [add_blob(level) for level in get_mipmaps(get_texture_layer(pg.image.load(source)))]}
+
+    for file in sorted(os.listdir(models)):
+        if not file.endswith('.obj'): continue
+        source = os.path.join(models, file)
+        arrays, meta = get_model_data(source)
+        index['models'][file[:-4]] = {'source': get_source(source), 'meta': meta, 'arrays': {key: add_blob(array) for key, array in arrays.items()}}
+
+    for file in sorted(os.listdir(shaders)):
+        source = os.path.join(shaders, file)
+        if not os.path.isfile(source): continue
+        with open(source, 'rb') as shader: index['shaders'][file] = {'source': get_source(source), 'blob': add_blob(shader.read())}
+
+    # Write to a temporary file first so a partly written bundle is never opened
+    header = json.dumps(index).encode()
+    data_start = align(HEADER.size + len(header))
+    temp = f'{path}.tmp'
+    with open(temp, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(header)))
+        file.write(header)
+        for offset, array in blobs:
+            file.write(bytes(data_start + offset - file.tell()))
+            file.write(array.tobytes())
+    os.replace(temp, path)
+
+
+def align(offset: int) -> int:
+    """
+    Rounds an offset up to the blob alignment
+    """
+
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+if __name__ == '__main__':
+    # Run from the project directory: python -m scripts.render.asset_bundle [path]
+    bake(*sys.argv[1:2])
@@ -0,0 +1,387 @@
+import numpy as np
+
+
+class DynamicBuffer:
+    """
+    GL buffer with spare capacity. Data is written in sub-ranges and the buffer regrows by doubling when it runs out of space.
+    """
+    def __init__(self, ctx, reserve: int=1024) -> None:
+        self.ctx = ctx
+        self.capacity = reserve  # In bytes
+        self.buffer = self.ctx.buffer(reserve=self.capacity)
+
+    def reserve(self, size: int, used: int) -> bool:
+        """
+        Makes sure the buffer can hold size bytes. Returns True if the buffer was reallocated, in which case any vao using it must be rebuilt.
+        Args:
+            size: int
+                The number of bytes the buffer needs to hold
+            used: int
+                The number of bytes currently in use. These are copied to the new buffer on regrow.
+        """
+
+        if size <= self.capacity: return False
+
+        # Amortized doubling
+        while self.capacity < size: self.capacity *= 2
+
+        # Copy the used range into a new buffer
+        buffer = self.ctx.buffer(reserve=self.capacity)
+        if used: self.ctx.copy_buffer(buffer, self.buffer, size=used)
+        self.buffer.release()
+        self.buffer = buffer
+
+        return True
+
+    def write(self, data: np.ndarray, offset: int) -> None:
+        """
+        Writes data to the buffer at the given byte offset
+        """
+
+        self.buffer.write(data, offset=offset)
+
+    def orphan(self) -> None:
+        """
+        Detaches the buffer's storage so it can be rewritten without waiting for draws still reading it
+        """
+
+        self.buffer.orphan()
+
+    def clear(self, size: int, offset: int) -> None:
+        """
+        Zeroes size bytes of the buffer at the given byte offset
+        """
+
+        self.buffer.clear(size, offset=offset)
+
+    def release(self) -> None:
+        self.buffer.release()
+
+
+class InstanceBatch:
+    """
+    Instance buffer for a single model in a single chunk.
+    Each object keeps a stable slot, so a changed object only rewrites its own row.
+    All instances are drawn with the same level of detail of the model, picked by the object handler from the camera distance.
+    """
+    rebuilds = False  # Objects are added and removed individually
+
+    def __init__(self, handler, vbo_key: str, capacity: int=16, lod: int=0) -> None:
+        self.handler = handler
+        self.ctx = handler.ctx
+        self.vbo = handler.vbos[vbo_key]
+
+        # Slot bookkeeping. objects[slot] is the object in that slot
+        self.objects = []
+        self.slots = {}
+
+        # Level of detail drawn and the largest bounding radius of the objects added since the last clear, used for picking the level
+        self.lod = lod
+        self.radius = 0.0
+
+        # Instance data buffer. Each level of detail drawn gets its own vao over the same buffer
+        self.row_size = handler.instance_row_size * 4  # In bytes
+        self.buffer = DynamicBuffer(self.ctx, capacity * self.row_size)
+        self.vaos = {}
+
+    def __iter__(self): return iter(self.objects)
+    def __contains__(self, object): return object in self.slots
+    def __len__(self): return len(self.objects)
+
+    def get_vao(self):
+        """
+        Returns the vao of the current level of detail, creating it from the shared indexed model vbo and the instance buffer if it has not been drawn yet
+        """
+
+        if self.lod not in self.vaos:
+            vbo = self.vbo.lods[self.lod]
+            self.vaos[self.lod] = vbo.get_vertex_array(self.handler.instance_program, (self.buffer.buffer, f'{self.handler.instance_format}/i', *self.handler.instance_attribs))
+
+        return self.vaos[self.lod]
+
+    def release_vaos(self) -> None:
+        """
+        Releases the vaos after the instance buffer was reallocated. They are recreated when next drawn.
+        """
+
+        for vao in self.vaos.values(): vao.release()
+        self.vaos.clear()
+
+    def update_radius(self, objects: list) -> None:
+        """
+        Grows the batch's radius to fit the given objects
+        """
+
+        indices = np.fromiter((object.index for object in objects), dtype='i4', count=len(objects))
+        self.radius = max(self.radius, float(self.handler.get_radii(indices).max()))
+
+    def add(self, objects: list, data: np.ndarray=None) -> None:
+        """
+        Gives each object a slot at the end of the buffer and writes its data. The rows are computed if data is not given.
+        """
+
+        if not objects: return
+
+        # Make room for the new objects
+        start = len(self.objects)
+        if self.buffer.reserve((start + len(objects)) * self.row_size, start * self.row_size): self.release_vaos()
+        self.update_radius(objects)
+
+        # Assign slots
+        for slot, object in enumerate(objects, start):
+            self.slots[object] = slot
+        self.objects.extend(objects)
+
+        # The new slots are contiguous so they are written in one call
+        if data is None: data = self.handler.get_instance_data(objects)
+        self.buffer.write(data, start * self.row_size)
+
+    def remove(self, objects: list) -> None:
+        """
+        Frees the slots of the objects by moving the last objects into them
+        """
+
+        moved = set()
+        for object in objects:
+            slot = self.slots.pop(object)
+            last = self.objects.pop()
+            moved.discard(object)
+
+            if last is object: continue
+
+            # Fill the hole with the last object
+            self.objects[slot] = last
+            self.slots[last] = slot
+            moved.add(last)
+
+        if moved: self.write(list(moved))
+
+    def write(self, objects: list, data: np.ndarray=None) -> None:
+        """
+        Rewrites the instance rows of the given objects. The rows are computed if data is not given.
+        """
+
+        if data is None: data = self.handler.get_instance_data(objects)
+        self.update_radius(objects)
+        for object, row in zip(objects, data):
+            self.buffer.write(row, self.slots[object] * self.row_size)
+
+    def clear(self) -> None:
+        """
+        Empties the batch while keeping its buffer so it can be reused by another chunk with the same model
+        """
+
+        self.objects.clear()
+        self.slots.clear()
+        self.radius = 0.0
+
+    def render(self) -> None:
+        if self.objects: self.get_vao().render(instances=len(self.objects))
+
+    def release(self) -> None:
+        self.release_vaos()
+        self.buffer.release()
+
+
+class StreamBatch(InstanceBatch):
+    """
+    Instance buffer for the dynamic objects with a single model and level of detail. The whole buffer is rewritten every frame instead of keeping slots.
+    """
+    def __init__(self, handler, vbo_key: str, lod: int=0, capacity: int=64) -> None:
+        super().__init__(handler, vbo_key, capacity, lod)
+        self.count = 0
+
+    def __len__(self): return self.count
+
+    def stream(self, data: np.ndarray) -> None:
+        """
+        Replaces the contents of the buffer with the given instance rows
+        """
+
+        self.count = len(data)
+        if not self.count: return
+
+        if self.buffer.reserve(self.count * self.row_size, 0): self.release_vaos()
+        else: self.buffer.orphan()
+
+        self.buffer.write(data, 0)
+
+    def render(self) -> None:
+        if self.count: self.get_vao().render(instances=self.count)
+
+
+class MeshBatch:
+    """
+    Combined mesh of all objects in a chunk.
+    Each object keeps a stable vertex range, so a changed object only rewrites its own range.
+    """
+    rebuilds = False  # Objects are added and removed individually
+
+    def __init__(self, handler, capacity: int=1024) -> None:
+        self.handler = handler
+        self.ctx = handler.ctx
+
+        # Range bookkeeping. ranges[object] = (first vertex, vertex count, vbo key)
+        self.ranges = {}
+        self.free_ranges = {}  # Contains lists of the first vertex of freed ranges, keyed by the vbo they were sized for
+        self.vertex_count = 0
+
+        # Mesh buffer
+        self.vertex_size = handler.mesh_row_size * 4  # In bytes
+        self.buffer = DynamicBuffer(self.ctx, capacity * self.vertex_size)
+        self.vao = self.get_vao()
+
+    def __iter__(self): return iter(self.ranges)
+    def __contains__(self, object): return object in self.ranges
+    def __len__(self): return len(self.ranges)
+
+    def get_vao(self):
+        return self.ctx.vertex_array(self.handler.program, [(self.buffer.buffer, self.handler.mesh_format, *self.handler.mesh_attribs)], skip_errors=True)
+
+    def add(self, objects: list, meshes: tuple=None) -> None:
+        """
+        Gives each object a vertex range. Ranges freed by removed objects with the same model are reused before appending to the end of the buffer.
+        Args:
+            meshes: tuple=None
+                Prebuilt (order, mesh array, vertex counts) as returned by build_mesh_data. Built from the objects if not given.
+        """
+
+        if not objects: return
+        if meshes is None: meshes = self.handler.build_mesh_data(*self.handler.get_rows(objects))
+        order, data, counts = meshes
+        objects = [objects[i] for i in order.tolist()]
+        firsts = np.cumsum(counts) - counts
+
+        # Reuse free ranges where possible and collect the rest to append
+        appended = []
+        for object, first, count in zip(objects, firsts.tolist(), counts.tolist()):
+            vbo = object.vbo
+            free = self.free_ranges.get(vbo)
+            if free:
+                start = free.pop()
+                self.ranges[object] = (start, count, vbo)
+                self.buffer.write(data[first:first + count], start * self.vertex_size)
+            else: appended.append((object, first, count, vbo))
+
+        if not appended: return
+
+        # The appended meshes are written in one call
+        if len(appended) < len(objects): data = np.concatenate([data[first:first + count] for object, first, count, vbo in appended])
+
+        # Make room for the new meshes
+        if self.buffer.reserve((self.vertex_count + len(data)) * self.vertex_size, self.vertex_count * self.vertex_size):
+            self.vao.release()
+            self.vao = self.get_vao()
+
+        # Assign ranges
+        start = self.vertex_count
+        for object, first, count, vbo in appended:
+            self.ranges[object] = (self.vertex_count, count, vbo)
+            self.vertex_count += count
+
+        self.buffer.write(data, start * self.vertex_size)
+
+    def remove(self, objects: list) -> None:
+        """
+        Frees the ranges of the objects. The ranges are zeroed so they draw as degenerate triangles until they are reused.
+        """
+
+        for object in objects:
+            first, count, vbo = self.ranges.pop(object)
+            self.buffer.clear(count * self.vertex_size, first * self.vertex_size)
+            if vbo not in self.free_ranges: self.free_ranges[vbo] = []
+            self.free_ranges[vbo].append(first)
+
+    def write(self, objects: list) -> None:
+        """
+        Rewrites the vertex ranges of the given objects
+        """
+
+        objects, data, counts = self.handler.get_meshes_data(objects)
+        start = 0
+        for object, count in zip(objects, counts.tolist()):
+            self.buffer.write(data[start:start + count], self.ranges[object][0] * self.vertex_size)
+            start += count
+
+    def clear(self) -> None:
+        """
+        Empties the batch while keeping its buffer so it can be reused by another chunk
+        """
+
+        self.ranges.clear()
+        self.free_ranges.clear()
+        self.vertex_count = 0
+
+    def render(self) -> None:
+        if self.vertex_count: self.vao.render(vertices=self.vertex_count)
+
+    def release(self) -> None:
+        self.vao.release()
+        self.buffer.release()
+
+
+class VoxelBatch:
+    """
+    Greedy meshed faces of the axis aligned cubes in a chunk.
+    Merged faces are shared between cubes, so the whole mesh is rebuilt whenever the chunk is updated.
+    """
+    rebuilds = True  # All objects of the batch are added again with the rebuilt mesh on every update
+
+    def __init__(self, handler, capacity: int=1024) -> None:
+        self.handler = handler
+        self.ctx = handler.ctx
+
+        self.objects = set()
+        self.vertex_count = 0
+
+        # Mesh buffer
+        self.vertex_size = handler.mesh_row_size * 4  # In bytes
+        self.buffer = DynamicBuffer(self.ctx, capacity * self.vertex_size)
+        self.vao = self.get_vao()
+
+    def __iter__(self): return iter(self.objects)
+    def __contains__(self, object): return object in self.objects
+    def __len__(self): return len(self.objects)
+
+    def get_vao(self):
+        return self.ctx.vertex_array(self.handler.program, [(self.buffer.buffer, self.handler.mesh_format, *self.handler.mesh_attribs)], skip_errors=True)
+
+    def add(self, objects: list, data: np.ndarray=None) -> None:
+        """
+        Adds the objects and replaces the mesh. The mesh of all objects in the batch is built if data is not given.
+        """
+
+        self.objects.update(objects)
+        if data is None: data = self.handler.build_voxel_data(*self.handler.get_rows(list(self.objects)))
+
+        if self.buffer.reserve(len(data) * self.vertex_size, 0):
+            self.vao.release()
+            self.vao = self.get_vao()
+
+        self.vertex_count = len(data)
+        if self.vertex_count: self.buffer.write(data, 0)
+
+    def remove(self, objects: list) -> None:
+        """
+        Removes the objects. Their faces stay in the mesh until it is replaced by the next add.
+        """
+
+        self.objects.difference_update(objects)
+
+    def write(self, objects: list) -> None:
+        """
+        Changed cubes are remeshed by rebuilding their chunk instead of rewriting their own vertices
+        """
+
+        pass
+
+    def clear(self) -> None:
+        self.objects.clear()
+        self.vertex_count = 0
+
+    def render(self) -> None:
+        if self.vertex_count: self.vao.render(vertices=self.vertex_count)
+
+    def release(self) -> None:
+        self.vao.release()
+        self.buffer.release()
@@ -0,0 +1,144 @@
+import numpy as np
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ChunkJob:
+    """
+    Pending rebuild of a single chunk. Holds the changes to the chunk's batches found when the chunk was updated.
+    """
+    def __init__(self, chunk: tuple, groups: dict, removed: dict, added: dict) -> None:
+        self.chunk   = chunk
+        self.groups  = groups   # Batch keys the chunk will have after the rebuild
+        self.removed = removed  # Contains lists of the objects leaving each batch
+        self.added   = added    # Contains lists of the objects joining each batch
+        self.data    = None     # Built data of the added objects of each batch, set once the build is done
+        self.stale   = set()    # Added objects that changed after their rows were gathered
+
+
+class ChunkBuilder:
+    """
+    Builds the buffer data of updated chunks on a thread pool. NumPy releases the GIL while building so the render thread keeps running.
+    Only the buffer uploads are done on the render thread, limited to upload_budget bytes and chunk_budget chunks per frame. A chunk keeps rendering its old batches until its rebuild is uploaded.
+    """
+    def __init__(self, handler, workers: int=4, upload_budget: int=4 * 2 ** 20, chunk_budget: int=256, part_size: int=4096) -> None:
+        self.handler = handler
+
+        # Builds run on the calling thread if there are no workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='chunk_builder') if workers else None
+
+        self.upload_budget = upload_budget  # Bytes uploaded per frame. At least one chunk is uploaded every frame
+        self.chunk_budget  = chunk_budget   # Chunks uploaded per frame. Creating a chunk's buffers has a fixed cost regardless of its size
+        self.part_size     = part_size      # Objects built per worker task. Small chunks are built together to save per call overhead
+
+        self.pending = {}       # Latest job of each chunk waiting to be uploaded
+        self.queue   = deque()  # Jobs with the future of their part in submit order
+        self.rebatched = set()  # Objects that are rebuilt in their batches even if they stay in the same batch, such as objects that changed model
+
+    def __len__(self): return len(self.pending)
+
+    def submit(self, chunks: set) -> None:
+        """
+        Finds the changes of the chunks and starts building the data of their new objects.
+        Jobs still pending for the chunks are replaced.
+        """
+
+        chunks = list(chunks)
+        groups = self.handler.get_batch_groups([list(self.handler.chunks.get(chunk, ())) for chunk in chunks])
+        jobs = [self.get_job(chunk, chunk_groups) for chunk, chunk_groups in zip(chunks, groups)]
+
+        # Split the jobs into parts of roughly part_size objects
+        part, size = [], 0
+        for job in jobs:
+            self.pending[job.chunk] = job
+            part.append(job)
+            size += sum(len(objects) for objects in job.added.values())
+            if size >= self.part_size:
+                self.submit_part(part)
+                part, size = [], 0
+        if part: self.submit_part(part)
+
+    def get_job(self, chunk: tuple, groups: dict) -> ChunkJob:
+        """
+        Diffs the grouped objects of a chunk against its current batches
+        """
+
+        batches = self.handler.batches.get(chunk, {})
+
+        # Rebatched objects leave their batch and join their group again so their data is rebuilt
+        rebatched = self.rebatched
+        removed = {key: list(set(batch) - groups.get(key, set()) | {object for object in rebatched if object in batch}) for key, batch in batches.items()}
+
+        # Batches that are rebuilt as a whole take all of their objects again
+        added = {key: list(group) if key not in batches or batches[key].rebuilds else list(group.difference(batches[key]) | (group & rebatched)) for key, group in groups.items()}
+
+        return ChunkJob(chunk, set(groups), removed, added)
+
+    def submit_part(self, jobs: list) -> None:
+        """
+        Gathers the rows of the added objects of the jobs on this thread and builds their data on a worker
+        """
+
+        segments = [(job, key) for job in jobs for key, objects in job.added.items() if objects]
+        sizes = [len(job.added[key]) for job, key in segments]
+        rows = self.handler.get_rows([object for job, key in segments for object in job.added[key]])
+
+        keys = [key for job, key in segments]
+        if self.executor: future = self.executor.submit(self.build, rows, sizes, keys)
+        else: future = self.build(rows, sizes, keys)
+
+        # Each job takes the results of its own segments once the part is built
+        keys = {job: {} for job in jobs}
+        for i, (job, key) in enumerate(segments): keys[job][key] = i
+        for job in jobs: self.queue.append((job, keys[job], future))
+
+    def build(self, rows: tuple, sizes: list, keys: list) -> list:
+        """
+        Runs on a worker thread. Returns the built data of each segment of the rows.
+        Args:
+            keys: list
+                Batch key of each segment
+        """
+
+        bounds = np.cumsum(sizes, dtype='i4')
+        if self.handler.instanced:
+            if not sizes: return []
+            return np.split(self.handler.build_instance_data(*rows), bounds[:-1])
+
+        return [self.handler.build_batch_data(key, *(row[start:end] for row in rows)) for key, start, end in zip(keys, (bounds - sizes).tolist(), bounds.tolist())]
+
+    def upload(self, flush: bool=False) -> None:
+        """
+        Uploads finished jobs in submit order until the frame's upload budget is used
+        Args:
+            flush: bool=False
+                Waits for and uploads every pending job regardless of the budget
+        """
+
+        uploaded, chunks = 0, 0
+        while self.queue:
+            job, keys, future = self.queue[0]
+
+            # Jobs replaced by a later submit are dropped
+            if self.pending.get(job.chunk) is not job:
+                self.queue.popleft()
+                continue
+
+            if not flush and (uploaded >= self.upload_budget or chunks >= self.chunk_budget or (self.executor and not future.done())): return
+            self.queue.popleft()
+            del self.pending[job.chunk]
+
+            # Take this job's segments out of the part's results
+            results = future.result() if self.executor else future
+            job.data = {key: results[i] for key, i in keys.items()}
+
+            uploaded += self.handler.apply_job(job)
+            chunks += 1
+
+    def mark_stale(self, object) -> None:
+        """
+        Marks an object whose rows changed after they may have been gathered for a pending job of its chunk, so it is rewritten when the job is uploaded
+        """
+
+        job = self.pending.get(object.chunk)
+        if job: job.stale.add(object)
@@ -0,0 +1,80 @@
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+
+
+class MeshCache:
+    """
+    On disk cache of the data derived from model files.
+    Entries are keyed by a hash of the model file's contents, so an entry is replaced automatically when its file changes.
+    Arrays are stored as .npy files and memory mapped when loaded, so they go to the GPU without being parsed or copied.
+    """
+
+    version = 2  # Part of every key. Bumped when the cached data changes so old entries are rebuilt
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+
+    def get_key(self, path: str) -> str:
+        """
+        Returns the hash of the file's contents and the cache version
+        """
+
+        hasher = hashlib.sha1(f'{self.version}:'.encode())
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(2 ** 20), b''): hasher.update(block)
+
+        return hasher.hexdigest()[:16]
+
+    def get_entry(self, path: str, key: str) -> str:
+        """
+        Returns the directory of a file's entry for the given key. Entries are named by the full file name, so files that only differ by extension have their own entries.
+        """
+
+        return os.path.join(self.directory, f'{os.path.basename(path)}-{key}')
+
+    def load(self, path: str) -> dict:
+        """
+        Returns the cached data of a file as a dict of the stored metadata and memory mapped arrays.
+        Returns None if the file has no entry for its current contents.
+        """
+
+        entry = self.get_entry(path, self.get_key(path))
+        try:
+            with open(os.path.join(entry, 'meta.json')) as file: meta = json.load(file)
+            arrays = {name: np.load(os.path.join(entry, f'{name}.npy'), mmap_mode='r') for name in meta['arrays']}
+        except (OSError, ValueError, KeyError):
+            return None
+
+        return {**meta, **arrays}
+
+    def save(self, path: str, arrays: dict, meta: dict) -> None:
+        """
+        Stores the data of a file, replacing the entries of its older contents.
+        The entry is written to a temporary directory first so a partly written entry is never loaded.
+        A cache that cannot be written is skipped and the data is rebuilt on the next run.
+        Args:
+            arrays: dict
+                Contains the arrays to store by name
+            meta: dict
+                JSON serializable data stored with the arrays
+        """
+
+        entry = self.get_entry(path, self.get_key(path))
+        name = os.path.basename(path)
+        temp = f'{entry}.{os.getpid()}.tmp'
+
+        try:
+            os.makedirs(temp, exist_ok=True)
+            for array_name, array in arrays.items(): np.save(os.path.join(temp, f'{array_name}.npy'), np.ascontiguousarray(array))
+            with open(os.path.join(temp, 'meta.json'), 'w') as file: json.dump({**meta, 'arrays': list(arrays)}, file)
+
+            # Remove the entries of the file's older contents before moving the new entry in. Temporary entries may still be written by other processes
+            for other in os.listdir(self.directory):
+                if other.rsplit('-', 1)[0] == name and not other.endswith('.tmp'):
+                    shutil.rmtree(os.path.join(self.directory, other), ignore_errors=True)
+            os.replace(temp, entry)
+        except OSError:
+            shutil.rmtree(temp, ignore_errors=True)
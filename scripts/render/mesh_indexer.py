@@ -0,0 +1,117 @@
+import numpy as np
+from numba import njit
+
+
+def index_mesh(vertex_data: np.ndarray, cache_size: int=16) -> tuple:
+    """
+    Converts a triangle list into deduplicated vertices and triangle indices.
+    Triangles are reordered for reuse of the GPU's post transform vertex cache, then vertices are ordered by their first use so fetches stay sequential.
+    Returns a tuple of (vertices, indices). Indices are u2 when the vertex count allows it, otherwise u4.
+    Args:
+        vertex_data: np.ndarray
+            (n, m) triangle list with n a multiple of 3
+        cache_size: int=16
+            Number of vertices the optimization assumes fit in the cache
+    """
+
+    vertices, indices = np.unique(vertex_data, axis=0, return_inverse=True)
+    indices = indices.reshape(-1).astype('i4')
+    if not len(indices): return vertices.astype('f4'), indices.astype('u2')
+
+    # Triangles of each vertex as a flattened adjacency list
+    triangle_ids = np.argsort(indices, kind='stable') // 3
+    offsets = np.zeros(shape=len(vertices) + 1, dtype='i4')
+    offsets[1:] = np.cumsum(np.bincount(indices, minlength=len(vertices)))
+
+    order = tipsify(indices, triangle_ids.astype('i4'), offsets, cache_size)
+    indices = indices.reshape(-1, 3)[order].reshape(-1)
+
+    # Renumber the vertices in the order they are first used
+    first_uses = np.unique(indices, return_index=True)[1]
+    vertex_order = np.argsort(first_uses, kind='stable')
+    remap = np.empty(shape=len(vertices), dtype='i4')
+    remap[vertex_order] = np.arange(len(vertices), dtype='i4')
+
+    return vertices[vertex_order].astype('f4'), remap[indices].astype('u2' if len(vertices) < 2 ** 16 else 'u4')
+
+
+@njit(cache=True)
+def tipsify(indices: np.ndarray, triangle_ids: np.ndarray, offsets: np.ndarray, cache_size: int) -> np.ndarray:
+    """
+    Tipsify triangle ordering (Sander et al. 2007). Fans around one vertex at a time, moving to the next vertex that is still in the cache and has the most triangles left.
+    Returns the new order of the triangles.
+    Args:
+        triangle_ids: np.ndarray
+            Triangles of vertex v are triangle_ids[offsets[v]:offsets[v + 1]]
+    """
+
+    vertex_count = len(offsets) - 1
+    triangle_count = len(indices) // 3
+
+    live = offsets[1:] - offsets[:-1]  # Triangles left to emit around each vertex
+    cache_times = np.zeros(vertex_count, dtype=np.int64)
+    emitted = np.zeros(triangle_count, dtype=np.bool_)
+    dead_end = np.empty(len(indices), dtype=np.int32)  # Stack of recently used vertices to restart from
+    dead_end_size = 0
+    candidates = np.empty(len(indices), dtype=np.int32)
+    order = np.empty(triangle_count, dtype=np.int32)
+    order_size = 0
+
+    time = cache_size + 1
+    cursor = 1
+    fan = 0
+
+    while fan >= 0:
+        # Emit all remaining triangles around the fanning vertex
+        candidate_count = 0
+        for i in range(offsets[fan], offsets[fan + 1]):
+            triangle = triangle_ids[i]
+            if emitted[triangle]: continue
+            emitted[triangle] = True
+            order[order_size] = triangle
+            order_size += 1
+
+            for j in range(3):
+                vertex = indices[triangle * 3 + j]
+                dead_end[dead_end_size] = vertex
+                dead_end_size += 1
+                candidates[candidate_count] = vertex
+                candidate_count += 1
+                live[vertex] -= 1
+
+                # Vertices not in the cache are loaded
+                if time - cache_times[vertex] > cache_size:
+                    cache_times[vertex] = time
+                    time += 1
+
+        # Prefer the candidate still in the cache with the most triangles left
+        fan = -1
+        best = -1
+        for i in range(candidate_count):
+            vertex = candidates[i]
+            if live[vertex] <= 0: continue
+            priority = 0
+            if time - cache_times[vertex] + 2 * live[vertex] <= cache_size: priority = time - cache_times[vertex]
+            if priority > best:
+                best = priority
+                fan = vertex
+
+        if fan >= 0: continue
+
+        # Otherwise restart from a recently used vertex, then from the next unfinished vertex in input order
+        while dead_end_size > 0:
+            dead_end_size -= 1
+            vertex = dead_end[dead_end_size]
+            if live[vertex] > 0:
+                fan = vertex
+                break
+
+        if fan >= 0: continue
+
+        while cursor < vertex_count:
+            if live[cursor] > 0:
+                fan = cursor
+                break
+            cursor += 1
+
+    return order
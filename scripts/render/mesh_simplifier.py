@@ -0,0 +1,90 @@
+import numpy as np
+
+
+def simplify(vertex_data: np.ndarray, resolution: int) -> np.ndarray:
+    """
+    Simplifies a triangle list by quadric error vertex clustering.
+    Vertices are snapped into a grid of cells and every cell is collapsed to the point with the least squared distance to the planes of its triangles.
+    Triangles with two corners in the same cell are dropped. The other attributes of each corner are kept.
+    Args:
+        vertex_data: np.ndarray
+            (n, m) triangle list where the first three columns of each row are the position
+        resolution: int
+            Number of cells along the longest side of the mesh's bounding box
+    """
+
+    positions = vertex_data[:,:3].astype('f8')
+
+    # Cell of each vertex
+    low, high = positions.min(axis=0), positions.max(axis=0)
+    cell_size = max(float(np.max(high - low)), 1e-9) / resolution
+    cells = np.minimum(np.floor((positions - low) / cell_size), resolution - 1).astype('i8')
+    keys, cell_ids = np.unique((cells[:,0] * resolution + cells[:,1]) * resolution + cells[:,2], return_inverse=True)
+    cells = np.stack([keys // resolution ** 2, keys // resolution % resolution, keys % resolution], axis=1)
+    n = len(cells)
+
+    # Plane of each triangle as (normal, offset), weighted by the triangle's area
+    triangles = positions.reshape(-1, 3, 3)
+    normals = np.cross(triangles[:,1] - triangles[:,0], triangles[:,2] - triangles[:,0])
+    areas = np.linalg.norm(normals, axis=1)
+    normals /= np.maximum(areas, 1e-12)[:,None]
+    planes = np.hstack([normals, -np.sum(normals * triangles[:,0], axis=1, keepdims=True)])
+
+    # Sum the quadric of each triangle into the cells of its corners
+    quadrics = (planes[:,:,None] * planes[:,None,:] * areas[:,None,None] / 2).reshape(-1, 16)
+    quadrics = np.repeat(quadrics, 3, axis=0)
+    cell_quadrics = np.stack([np.bincount(cell_ids, quadrics[:,i], minlength=n) for i in range(16)], axis=1).reshape(n, 4, 4)
+
+    # Mean of the vertices in each cell, used where the quadric has no unique minimum
+    counts = np.bincount(cell_ids, minlength=n)[:,None]
+    means = np.stack([np.bincount(cell_ids, positions[:,i], minlength=n) for i in range(3)], axis=1) / counts
+
+    # Solve for the point minimizing each cell's quadric relative to the cell's mean
+    A, b = cell_quadrics[:,:3,:3], cell_quadrics[:,:3,3]
+    rhs = -(b + np.einsum('nij,nj->ni', A, means))
+    scale = np.maximum(np.trace(A, axis1=1, axis2=2), 1e-12)
+    solvable = np.linalg.det(A / scale[:,None,None]) > 1e-6
+    points = means.copy()
+    if solvable.any(): points[solvable] += np.linalg.solve(A[solvable], rhs[solvable][:,:,None])[:,:,0]
+
+    # Keep the points inside their cells so thin features don't produce spikes
+    cell_low = low + cells * cell_size
+    points = np.clip(points, cell_low, cell_low + cell_size)
+
+    # Drop triangles that collapsed and duplicates of the same three cells
+    corners = cell_ids.reshape(-1, 3)
+    kept = (corners[:,0] != corners[:,1]) & (corners[:,1] != corners[:,2]) & (corners[:,0] != corners[:,2])
+    kept_ids = np.flatnonzero(kept)
+    sorted_corners = np.sort(corners[kept_ids], axis=1).astype('i8')
+    kept_ids = kept_ids[np.unique((sorted_corners[:,0] * n + sorted_corners[:,1]) * n + sorted_corners[:,2], return_index=True)[1]]
+    kept_ids.sort()
+
+    # Build the simplified triangle list
+    rows = (kept_ids[:,None] * 3 + np.arange(3)).reshape(-1)
+    data = vertex_data[rows].copy()
+    data[:,:3] = points[cell_ids[rows]]
+    return data.astype('f4')
+
+
+def get_lods(vertex_data: np.ndarray, levels: int=3, ratio: float=0.5, min_triangles: int=64) -> list:
+    """
+    Returns a list of up to levels simplified versions of a mesh, each with at most ratio of the triangles of the one before.
+    Stops early once a level would have fewer than min_triangles triangles.
+    """
+
+    lods = []
+    triangles = len(vertex_data) // 3
+    resolution = 2 ** int(np.ceil(np.log2(max(np.sqrt(triangles), 2))))
+
+    while len(lods) < levels and resolution >= 2:
+        data = simplify(vertex_data, resolution)
+        resolution //= 2
+
+        # Coarser grids are tried until the level is small enough
+        if len(data) // 3 > triangles * ratio: continue
+        if len(data) // 3 < min_triangles: break
+
+        lods.append(data)
+        triangles = len(data) // 3
+
+    return lods
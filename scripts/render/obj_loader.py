@@ -0,0 +1,198 @@
+import numpy as np
+
+
+WHITESPACE = np.array([ord(' '), ord('\t'), ord('\r'), ord('\n')], dtype='u1')
+IS_WHITESPACE = np.isin(np.arange(256), WHITESPACE)  # Lookup table of whitespace bytes
+
+# Attributes of each kind of face corner, found from the first face of the file
+CORNER_FORMATS = {
+    'v':     ('3f 3f',    ['in_position', 'in_normal']),
+    'v//vn': ('3f 3f',    ['in_position', 'in_normal']),
+    'v/vt':  ('3f 2f 3f', ['in_position', 'in_uv', 'in_normal']),
+    'v/vt/vn': ('3f 2f 3f', ['in_position', 'in_uv', 'in_normal']),
+}
+
+
+class ObjModel:
+    """
+    Vertex data of a loaded .obj file
+    """
+    def __init__(self, vertex_data: np.ndarray, format: str, attribs: list) -> None:
+        self.vertex_data = vertex_data  # Triangle list with interleaved attributes
+        self.format = format
+        self.attribs = attribs
+
+
+class ObjLoader:
+    """
+    Reads .obj files in large blocks with NumPy instead of line by line.
+    Each block is split into lines by byte masks and the numbers of all lines of a kind are parsed in one call, so no Python objects are made per vertex.
+    Faces are kept as compact index arrays and the triangle list is built in bounded size chunks once the whole file is read.
+    Corners without normals get the normal of their triangle, and faces with more than three corners are split into fans.
+    """
+    def __init__(self, block_size: int=2 ** 22, chunk_size: int=2 ** 18) -> None:
+        self.block_size = block_size  # Bytes read and parsed at once
+        self.chunk_size = chunk_size  # Triangles built at once
+
+    def load(self, path: str) -> ObjModel:
+        """
+        Loads the triangles of an .obj file. Objects, groups and materials are ignored, so triangles stay in file order.
+        """
+
+        self.points, self.uvs, self.normals, self.faces = [], [], [], []
+        self.counts = np.zeros(shape=3, dtype='i8')  # Points, uvs and normals read so far, used for relative indices
+        self.corner_format = None
+
+        with open(path, 'rb') as file:
+            rest = b''
+            while block := file.read(self.block_size):
+                # Only whole lines are parsed. The partial last line is carried to the next block
+                block = rest + block
+                end = block.rfind(b'\n') + 1
+                rest = block[end:]
+                if end: self.parse_block(block[:end])
+            if rest: self.parse_block(rest + b'\n')
+
+        if not self.corner_format: raise ValueError(f'{path} has no faces')
+
+        format, attribs = CORNER_FORMATS[self.corner_format]
+        return ObjModel(self.build(), format, attribs)
+
+    def parse_block(self, block: bytes) -> None:
+        """
+        Parses the v, vt, vn and f lines of a block of whole lines
+        """
+
+        data = np.frombuffer(block, dtype='u1')
+
+        # Line of every byte and the first two bytes of every line
+        ends = np.flatnonzero(data == ord('\n'))
+        starts = np.r_[0, ends[:-1] + 1]
+        line_ids = np.zeros(shape=len(data), dtype='i4')
+        line_ids[ends[:-1] + 1] = 1
+        line_ids = np.cumsum(line_ids)
+        first = data[starts]
+        second = np.where(starts + 1 < len(data), data[np.minimum(starts + 1, len(data) - 1)], ord('\n'))
+        separated = (second == ord(' ')) | (second == ord('\t'))
+        third = np.where(starts + 2 < len(data), data[np.minimum(starts + 2, len(data) - 1)], ord('\n'))
+
+        is_point  = (first == ord('v')) & separated
+        is_uv     = (first == ord('v')) & (second == ord('t')) & ((third == ord(' ')) | (third == ord('\t')))
+        is_normal = (first == ord('v')) & (second == ord('n')) & ((third == ord(' ')) | (third == ord('\t')))
+        is_face   = (first == ord('f')) & separated
+
+        # Number of each kind of vertex before every line, for resolving relative indices
+        before = self.counts[:,None] + np.cumsum(np.stack([is_point, is_uv, is_normal]), axis=1) - np.stack([is_point, is_uv, is_normal])
+
+        for values, mask, prefix, size in ((self.points, is_point, 2, 3), (self.uvs, is_uv, 3, 2), (self.normals, is_normal, 3, 3)):
+            if mask.any(): values.append(self.parse_numbers(data, line_ids, mask, prefix, 'f4', size))
+        self.counts += [is_point.sum(), is_uv.sum(), is_normal.sum()]
+
+        if is_face.any(): self.faces.append(self.parse_faces(block, data, line_ids, starts, ends, is_face, before))
+
+    def parse_numbers(self, data: np.ndarray, line_ids: np.ndarray, mask: np.ndarray, prefix: int, dtype: str, size: int) -> np.ndarray:
+        """
+        Parses the first size numbers after the prefix of every masked line. Returns an (n, size) array.
+        """
+
+        values, counts = self.parse_lines(data, line_ids, mask, prefix, dtype)
+        if np.all(counts == size): return values.reshape(-1, size)
+
+        # Lines with extra values such as vertex colors or w components
+        firsts = np.cumsum(counts) - counts
+        return values[firsts[:,None] + np.arange(size)]
+
+    def parse_lines(self, data: np.ndarray, line_ids: np.ndarray, mask: np.ndarray, prefix: int, dtype: str) -> tuple:
+        """
+        Parses all numbers after the prefix of every masked line at once.
+        Returns a tuple of (values, number of values on each masked line)
+        """
+
+        # Bytes of the masked lines, including the newlines that separate them. The prefixes are blanked
+        text = data[mask[line_ids]]
+        newlines = np.flatnonzero(text == ord('\n'))
+        line_starts = np.r_[0, newlines[:-1] + 1]
+        for i in range(prefix): text[line_starts + i] = ord(' ')
+
+        # A number starts at every non whitespace byte after a whitespace byte
+        whitespace = IS_WHITESPACE[text]
+        number_starts = ~whitespace & np.r_[True, whitespace[:-1]]
+        counts = np.diff(np.cumsum(number_starts)[newlines], prepend=0)
+
+        values = np.fromstring(text.tobytes(), dtype=dtype, sep=' ')
+        if len(values) != counts.sum(): raise ValueError('Could not parse obj lines')
+        return values, counts
+
+    def parse_faces(self, block: bytes, data: np.ndarray, line_ids: np.ndarray, starts: np.ndarray, ends: np.ndarray, mask: np.ndarray, before: np.ndarray) -> np.ndarray:
+        """
+        Parses the face lines into an (n, 3, 3) array of zero based (point, uv, normal) indices of each triangle corner. Missing attributes are -1.
+        """
+
+        # The kind of corner is read from the first face, like other obj loaders
+        if not self.corner_format:
+            line = block[starts[mask][0]:ends[mask][0]].split()[1].decode()
+            parts = line.split('/')
+            self.corner_format = ['v', 'v/vt', 'v/vt/vn'][len(parts) - 1] if len(parts) < 3 or parts[1] else 'v//vn'
+        attributes = {'v': [0], 'v//vn': [0, 2], 'v/vt': [0, 1], 'v/vt/vn': [0, 1, 2]}[self.corner_format]
+
+        # Slashes separate numbers the same way as spaces
+        data = np.where(data == ord('/'), ord(' '), data).astype('u1')
+        values, counts = self.parse_lines(data, line_ids, mask, 2, 'i8')
+        corner_counts = counts // len(attributes)
+        values = values.reshape(-1, len(attributes))
+
+        # Resolve one based and relative indices
+        indices = np.full(shape=(len(values), 3), fill_value=-1, dtype='i8')
+        before = np.repeat(before[:,mask].T, corner_counts, axis=0)
+        for column, attribute in enumerate(attributes):
+            index = values[:,column]
+            indices[:,attribute] = np.where(index > 0, index - 1, before[:,attribute] + index)
+
+        # Split the faces into triangle fans around their first corner
+        firsts = np.cumsum(corner_counts) - corner_counts
+        fans = corner_counts - 2
+        face_starts = np.repeat(firsts, fans)
+        offsets = np.arange(fans.sum()) - np.repeat(np.cumsum(fans) - fans, fans)
+        corners = np.stack([face_starts, face_starts + offsets + 1, face_starts + offsets + 2], axis=1)
+        return indices[corners].astype('i4')
+
+    def build(self) -> np.ndarray:
+        """
+        Builds the interleaved triangle list from the parsed faces in chunks of chunk_size triangles
+        """
+
+        points  = np.concatenate(self.points)  if self.points  else np.zeros(shape=(0, 3), dtype='f4')
+        uvs     = np.concatenate(self.uvs)     if self.uvs     else np.zeros(shape=(0, 2), dtype='f4')
+        normals = np.concatenate(self.normals) if self.normals else np.zeros(shape=(0, 3), dtype='f4')
+        faces = np.concatenate(self.faces)
+
+        has_uv = self.corner_format.startswith('v/vt')
+        has_normal = self.corner_format.endswith('vn')
+        row_size = 8 if has_uv else 6
+        vertex_data = np.empty(shape=(len(faces) * 3, row_size), dtype='f4')
+
+        for start in range(0, len(faces), self.chunk_size):
+            triangles = faces[start:start + self.chunk_size]
+            rows = vertex_data[start * 3:(start + len(triangles)) * 3].reshape(-1, 3, row_size)
+
+            rows[:,:,:3] = points[triangles[:,:,0]]
+            if has_uv: rows[:,:,3:5] = uvs[triangles[:,:,1]]
+
+            if has_normal:
+                rows[:,:,-3:] = normals[triangles[:,:,2]]
+                continue
+
+            # Corners without normals use the normal of their triangle
+            normal = np.cross(rows[:,1,:3] - rows[:,0,:3], rows[:,2,:3] - rows[:,0,:3])
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rows[:,:,-3:] = (normal / np.linalg.norm(normal, axis=1, keepdims=True))[:,None]
+
+        return vertex_data
+
+
+def load_obj(path: str) -> ObjModel:
+    """
+    Loads an .obj file with the default block and chunk sizes
+    """
+
+    return ObjLoader().load(path)
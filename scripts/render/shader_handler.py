@@ -14,6 +14,7 @@ class ShaderHandler:
 
         self.programs['default'] = self.load_program('default')
         self.programs['batch'] = self.load_program('batch')
+        self.programs['instance'] = self.load_program('instance')
 
     def load_program(self, name: str='default') -> mgl.Program:
         """
@@ -21,11 +22,8 @@ class ShaderHandler:
         Parses through shaders to identify uniforms and save for writting
         """
 
-        # Read the shaders
-        with open(f'shaders/{name}.vert') as file:
-            vertex_shader = file.read()
-        with open(f'shaders/{name}.frag') as file:
-            fragment_shader = file.read()
+        # Read the shaders, from the project's bundle if they are baked and unchanged
+        vertex_shader, fragment_shader = self.read_shader(f'{name}.vert'), self.read_shader(f'{name}.frag')
             
         # Create blank list for uniforms
         self.uniform_attribs[name] = []
@@ -41,6 +39,18 @@ class ShaderHandler:
         program = self.ctx.program(vertex_shader=vertex_shader, fragment_shader=fragment_shader)
         return program
 
+    def read_shader(self, file: str) -> str:
+        """
+        Returns the source of a file in the shaders directory
+        """
+
+        path = f'shaders/{file}'
+        source = self.project.bundle.get_shader(file, path) if self.project.bundle else None
+        if source is not None: return source
+
+        with open(path) as shader:
+            return shader.read()
+
     def set_camera(self, camera):
         """
         Sets the camera. Allows for camera switching between any camera in the project        
@@ -0,0 +1,14 @@
+from scripts.render.mesh_cache import MeshCache
+
+
+class TextureCache(MeshCache):
+    """
+    On disk cache of the mip chains of textures scaled to their size bucket and flipped for upload, so images are not decoded, scaled or filtered again on later runs.
+    Entries are stored and keyed like the mesh cache. The bucket sizes are part of the key, so entries are rebuilt when the sizes change.
+    """
+
+    version = 2
+
+    def __init__(self, directory: str, sizes: tuple) -> None:
+        super().__init__(directory)
+        self.version = f'{TextureCache.version}:{sizes}'
@@ -2,10 +2,87 @@ import pygame as pg
 import numpy as np
 import moderngl as mgl
 import os
+import ctypes
+from concurrent.futures import ThreadPoolExecutor
+from scripts.render.asset_bundle import AssetBundle
+from scripts.render.texture_cache import TextureCache
+
+# Side lengths of the texture arrays. Textures are scaled to the closest size
+TEXTURE_SIZES = (128, 256, 512, 1024, 2048)
+
+# OpenGL enums used to upload mip levels, which moderngl's texture arrays cannot write
+GL_TEXTURE_2D_ARRAY = 0x8C1A
+GL_UNPACK_ALIGNMENT = 0x0CF5
+GL_RGB8             = 0x8051
+GL_RGB              = 0x1907
+GL_UNSIGNED_BYTE    = 0x1401
+
+
+def get_texture_layer(texture: pg.Surface, sizes: tuple=TEXTURE_SIZES) -> np.ndarray:
+    """
+    Scales an image to its closest size bucket and flips it for OpenGL.
+    Returns the (size, size, 3) RGB data of the image's layer in its texture array.
+    """
+
+    # Get the closest size
+    original_size = texture.get_size()[0]
+    distances = np.array([abs(bucket_size - original_size) for bucket_size in sizes])
+    size = sizes[np.argmin(distances)]
+
+    # Rescale to closest size bucket
+    texture = pg.transform.scale(texture, (size, size))
+    texture = pg.transform.flip(texture, False, True)
+
+    return np.frombuffer(pg.image.tostring(texture, 'RGB'), dtype='u1').reshape(size, size, 3)
+
+
+def get_mipmaps(layer: np.ndarray) -> list:
+    """
+    Returns the mip chain of a (size, size, 3) layer, from the layer itself down to 1x1.
+    Each level is a 2x2 box filter of the level above it. Levels are filtered in float so rounding does not add up down the chain.
+    """
+
+    mipmaps, level = [layer], layer.astype('f4')
+    while level.shape[0] > 1:
+        size = level.shape[0] // 2
+        level = level.reshape(size, 2, size, 2, 3).mean(axis=(1, 3))
+        mipmaps.append(np.rint(level).astype('u1'))
+
+    return mipmaps
+
+
+def get_gl_functions(ctx: mgl.Context) -> dict:
+    """
+    Returns the OpenGL functions used to upload mip levels, loaded by the context's own loader.
+    Returns None if they can't be loaded, in which case mipmaps are built on the GPU.
+    """
+
+    loader = getattr(ctx.mglo, '_context', None)
+    if loader is None: return None
+
+    function_type = ctypes.WINFUNCTYPE if os.name == 'nt' else ctypes.CFUNCTYPE
+    GLenum, GLint, GLsizei, pointer = ctypes.c_uint, ctypes.c_int, ctypes.c_int, ctypes.c_void_p
+    types = {
+        'glPixelStorei'   : function_type(None, GLenum, GLint),
+        'glTexImage3D'    : function_type(None, GLenum, GLint, GLint, GLsizei, GLsizei, GLsizei, GLint, GLenum, GLenum, pointer),
+        'glTexSubImage3D' : function_type(None, GLenum, GLint, GLint, GLint, GLint, GLsizei, GLsizei, GLsizei, GLenum, GLenum, pointer),
+    }
+
+    addresses = {name : loader.load(name) for name in types}
+    if not all(addresses.values()): return None
+    return {name : types[name](address) for name, address in addresses.items()}
+
+
+def get_layer_bytes(size: int) -> int:
+    """
+    Returns the GPU memory of one RGB layer of a texture array, including its mipmaps
+    """
+
+    return size * size * 3 * 4 // 3
 
 
 class TextureHandler:
-    def __init__(self, engine, vao_handler, directory: str='textures') -> None:
+    def __init__(self, engine, vao_handler, directory: str='textures', bundle: AssetBundle=None, budget: int=None) -> None:
         # Stores the engine and context
         self.engine = engine
         self.vao_handler = vao_handler
@@ -13,15 +90,33 @@ class TextureHandler:
 
         # The folder containing all textures for the project
         self.directory = directory
+        # Baked texture layers are used when they are up to date with the image file
+        self.bundle = bundle
 
-        # Dictionary containing all texture's data. This is not the texture itself.
+        # Dictionary containing all texture's mip chains on the CPU, from the (size, size, 3) layer down to 1x1. This is not the texture itself.
         self.textures = {}
         self.texture_ids = {}
 
         # Dictionary containing all texture arrays
-        self.sizes = (128, 256, 512, 1024, 2048)
+        self.sizes = TEXTURE_SIZES
         self.texture_arrays = {size : [] for size in self.sizes}
 
+        # Scaled textures are kept between runs
+        self.cache = TextureCache(os.path.join(directory, '.cache'), self.sizes) if directory else None
+
+        # Bytes of GPU memory the texture arrays may use. If all textures do not fit, each array only has slots for part of its layers.
+        # Layers are streamed into the slots as they are used, replacing the least recently used ones. None keeps every layer resident.
+        self.budget = budget
+        self.layers = {}  # Names of the textures in each array by layer
+        self.layer_slots = {}  # Slot of each layer in its array, -1 if it is not resident
+        self.slot_layers = {}  # Layer in each slot of an array, -1 if the slot is free
+        self.last_used = {}  # Frame each layer was last used on
+        self.frame = 0
+        self.layer_map = None  # Integer texture of the slot of each (array, layer) texture id, read by the shaders
+
+        # Mip levels are precomputed on the CPU and uploaded with these functions
+        self.gl = get_gl_functions(self.ctx)
+
         # Load all textures
         self.load_directory()
 
@@ -32,59 +127,186 @@ class TextureHandler:
             program[f'textureArrays[{i}].array'] = i + 3
             self.texture_arrays[size].use(location=i+3)
 
+        program['layerMap'] = 2
+        self.layer_map.use(location=2)
+
     def generate_texture_arrays(self):
-        size_data = {size : [] for size in self.sizes}
+        """
+        Uploads the loaded textures to one texture array per size, with one upload per array.
+        With a budget, the layers that do not fit in the array's slots are uploaded by use_textures when they are used.
+        """
+
         self.texture_ids.clear()
 
-        for texture in self.textures:
-            data = self.textures[texture][0].read()
-            size = self.textures[texture][1]
-            location = (self.sizes.index(size), len(size_data[size]))
+        # Layer of each texture in its size's array
+        self.layers = {size : [] for size in self.sizes}
+        for texture, (mipmaps, size) in self.textures.items():
+            self.texture_ids[texture] = (self.sizes.index(size), len(self.layers[size]))
+            self.layers[size].append(texture)
 
-            size_data[size].append(data)
-            self.texture_ids[texture] = location
+        counts = {size : len(self.layers[size]) for size in self.sizes}
+        slots = self.get_slot_counts(counts)
+
+        # The first layers that fit are resident from the start
+        self.layer_slots = {size : np.full(shape=counts[size], fill_value=-1, dtype='i4') for size in self.sizes}
+        self.slot_layers = {size : np.arange(slots[size], dtype='i4') for size in self.sizes}
+        self.last_used = {size : np.zeros(shape=counts[size], dtype='i8') for size in self.sizes}
+        for size in self.sizes: self.layer_slots[size][:slots[size]] = self.slot_layers[size]
+
+        # Copy the resident layers into staging arrays per size, one for each mip level
+        staging = {size : [np.empty(shape=(slots[size], size >> level, size >> level, 3), dtype='u1') for level in range(size.bit_length())] for size in self.sizes}
+        for size in self.sizes:
+            for layer, texture in enumerate(self.layers[size][:slots[size]]):
+                for level, data in zip(staging[size], self.textures[texture][0]): level[layer] = data
 
         for size in self.sizes:
-            data = np.array(size_data[size])
-            self.texture_arrays[size] = self.ctx.texture_array((size, size, len(size_data[size])), 3, data)
-            # Mipmaps
-            self.texture_arrays[size].build_mipmaps()
+            if not isinstance(self.texture_arrays[size], list): self.texture_arrays[size].release()
+            self.texture_arrays[size] = self.ctx.texture_array((size, size, slots[size]), 3, staging[size][0])
+            # Mipmaps are uploaded from the precomputed levels, or built on the GPU if the upload functions are missing
+            if self.gl: self.write_mipmaps(size, staging[size][1:])
+            else: self.texture_arrays[size].build_mipmaps()
             self.texture_arrays[size].filter = (mgl.NEAREST_MIPMAP_NEAREST, mgl.NEAREST)
             # AF
             self.texture_arrays[size].anisotropy = 32.0
 
+        # Slot lookup table with a row per array and a column per layer
+        if self.layer_map: self.layer_map.release()
+        self.layer_map = self.ctx.texture((max(max(counts.values()), 1), len(self.sizes)), 1, dtype='i4')
+        self.layer_map.filter = (mgl.NEAREST, mgl.NEAREST)
+        self.write_layer_map()
+
+    def write_mipmaps(self, size: int, levels: list, slot: int=None) -> None:
+        """
+        Uploads mip levels to a texture array. Level 0 is written by moderngl, so the levels start at level 1.
+        Args:
+            levels: list
+                Data of each level from level 1 down
+            slot: int=None
+                Slot whose levels are written. If None, the levels hold every slot and their storage is allocated
+        """
+
+        array = self.texture_arrays[size]
+        # Bound to moderngl's own unit for writes so the units used for rendering keep their textures
+        array.use(location=self.ctx.default_texture_unit)
+        self.gl['glPixelStorei'](GL_UNPACK_ALIGNMENT, 1)
+
+        for level, data in enumerate(levels, 1):
+            data = np.ascontiguousarray(data)
+            level_size = size >> level
+            if slot is None: self.gl['glTexImage3D'](GL_TEXTURE_2D_ARRAY, level, GL_RGB8, level_size, level_size, array.layers, 0, GL_RGB, GL_UNSIGNED_BYTE, data.ctypes.data)
+            else: self.gl['glTexSubImage3D'](GL_TEXTURE_2D_ARRAY, level, 0, 0, slot, level_size, level_size, 1, GL_RGB, GL_UNSIGNED_BYTE, data.ctypes.data)
+
+    def get_slot_counts(self, counts: dict) -> dict:
+        """
+        Returns the number of layer slots of each array. The budget is split between the arrays by the size of their textures.
+        Every array with textures keeps at least one slot.
+        """
+
+        total = sum(counts[size] * get_layer_bytes(size) for size in self.sizes)
+        if self.budget is None or total <= self.budget: return dict(counts)
+
+        return {size : min(max(int(self.budget / total * counts[size]), 1), counts[size]) for size in self.sizes}
+
+    def write_layer_map(self) -> None:
+        """
+        Writes the slot of every layer to the layer map texture
+        """
+
+        layer_map = np.full(shape=(len(self.sizes), self.layer_map.width), fill_value=-1, dtype='i4')
+        for i, size in enumerate(self.sizes):
+            layer_map[i, :len(self.layer_slots[size])] = self.layer_slots[size]
+        self.layer_map.write(layer_map)
+
+    def use_textures(self, texture_ids: np.ndarray) -> None:
+        """
+        Marks the textures used this frame and streams in the ones that are not resident, replacing the least recently used layers.
+        Used textures that do not fit in the budget are drawn grey until they are streamed in.
+        Args:
+            texture_ids: np.ndarray
+                (n, 2) unique (array, layer) ids of the textures in view, as given by texture_ids
+        """
+
+        self.frame += 1
+        streamed = False
+
+        for i, size in enumerate(self.sizes):
+            layers = texture_ids[texture_ids[:,0] == i, 1]
+            if not len(layers): continue
+            self.last_used[size][layers] = self.frame
+
+            missing = layers[self.layer_slots[size][layers] < 0]
+            if not len(missing): continue
+
+            # Free slots are filled first, then the slots of the least recently used layers that are not used this frame
+            slot_layers = self.slot_layers[size]
+            ages = np.where(slot_layers < 0, -1, self.last_used[size][slot_layers])
+            slots = np.flatnonzero(ages < self.frame)
+            slots = slots[np.argsort(ages[slots], kind='stable')][:len(missing)]
+
+            for slot, layer in zip(slots.tolist(), missing.tolist()):
+                if slot_layers[slot] >= 0: self.layer_slots[size][slot_layers[slot]] = -1
+                slot_layers[slot] = layer
+                self.layer_slots[size][layer] = slot
+                mipmaps = self.textures[self.layers[size][layer]][0]
+                self.texture_arrays[size].write(mipmaps[0], viewport=(0, 0, slot, size, size, 1))
+                if self.gl: self.write_mipmaps(size, mipmaps[1:], slot)
+
+            if len(slots):
+                if not self.gl: self.texture_arrays[size].build_mipmaps()
+                streamed = True
+
+        if streamed: self.write_layer_map()
+
+    def get_resident_bytes(self) -> int:
+        """
+        Returns the GPU memory used by the slots of all texture arrays
+        """
+
+        return sum(len(self.slot_layers[size]) * get_layer_bytes(size) for size in self.sizes)
+
     def load_texture(self, name: str, file: str) -> None:
         """
         Loads a texture in the project texture directory.
         If no directory was given on init, full path is expected in the file argument.
         File argument should include the file extension.
+        The texture is uploaded on the next call to generate_texture_arrays.
+        """
+
+        mipmaps = self.read_texture(file)
+        self.textures[file[1:-4]] = (mipmaps, mipmaps[0].shape[0])
+
+    def read_texture(self, file: str) -> list:
+        """
+        Returns the mip chain of a texture file, as given by get_mipmaps. Safe to call from worker threads.
         """
 
         # Constructs the path based on file and directory
         if self.directory: path = self.directory + file
         else: path = file
 
-        # Loads image using pygame
-        texture = pg.image.load(path).convert()
-
-        # Get the closest size
-        original_size = texture.get_size()[0]
-        distances = np.array([abs(bucket_size - original_size) for bucket_size in self.sizes])
-        size = self.sizes[np.argmin(distances)]
+        # Uses the baked mip chain if there is one
+        mipmaps = self.bundle.get_texture(file[1:], path) if self.bundle else None
+        if mipmaps is not None: return mipmaps
 
-        # Rescale to closest size bucket
-        texture = pg.transform.scale(texture, (size, size))
-        texture = pg.transform.flip(texture, False, True)
+        # Uses the mip chain cached on an earlier run if the image has not changed
+        cached = self.cache.load(path) if self.cache else None
+        if cached: return [cached[f'level{level}'] for level in range(len(cached['arrays']))]
 
-        # Make a texture
-        texture = self.ctx.texture(size=texture.get_size(), components=3, data=pg.image.tostring(texture, 'RGB'))
-
-        self.textures[file[1:-4]] = (texture, size)
+        # Otherwise loads image using pygame and filters its mip chain
+        mipmaps = get_mipmaps(get_texture_layer(pg.image.load(path), self.sizes))
+        if self.cache: self.cache.save(path, {f'level{level}': data for level, data in enumerate(mipmaps)}, {})
+        return mipmaps
 
     def load_directory(self):
-        for file in os.listdir(self.directory):
-            file = '/' + file
-            self.load_texture(file, file)
+        # Textures in the bundle do not need their files
+        files = {file for file in os.listdir(self.directory) if os.path.isfile(os.path.join(self.directory, file))} if os.path.isdir(self.directory) else set()
+        if self.bundle: files |= set(self.bundle.names('textures'))
+        files = ['/' + file for file in sorted(files)]
+
+        # Images are decoded, scaled and filtered in parallel. Pygame and NumPy release the GIL while they work
+        with ThreadPoolExecutor() as pool:
+            for file, mipmaps in zip(files, pool.map(self.read_texture, files)):
+                self.textures[file[1:-4]] = (mipmaps, mipmaps[0].shape[0])
         
         self.generate_texture_arrays()
         self.write_textures()
@@ -94,4 +316,7 @@ class TextureHandler:
         Releases all textures in a project
         """
 
-        [tex.release() for tex in self.textures.values()]
\ No newline at end of file
+        [array.release() for array in self.texture_arrays.values() if not isinstance(array, list)]
+        if self.layer_map: self.layer_map.release()
+        # Drop the CPU mip chains, which can be views of the asset bundle's memory map
+        self.textures.clear()
\ No newline at end of file
@@ -1,37 +1,48 @@
 from scripts.render.vbo_handler import VBOHandler
 from scripts.render.shader_handler import ShaderHandler
+from scripts.generic.data_types import LazyDict
 
 
 class VAOHandler:
     """
-    Stores VBO and shader handlers. Creates VAOs
+    Stores VBO and shader handlers. Creates VAOs, by default on the first use of a model's name
     """
     def __init__(self, project):
         self.project = project
         self.ctx = self.project.ctx
     
         self.shader_handler = ShaderHandler(self.project)
-        self.vbo_handler = VBOHandler(self.ctx)
+        self.vbo_handler = VBOHandler(self.ctx, bundle=self.project.bundle)
 
-        self.vaos = {}
-        self.add_vao()
-        self.add_vao('cow', 'default', 'cow')
-        self.add_vao('bunny', 'default', 'bunny')
-        self.add_vao('lucy', 'default', 'lucy')
+        # VAOs missing from the dict are made for the model with the same name and the default program
+        self.vaos = LazyDict(lambda name: self.get_vao('default', name))
 
     def add_vao(self, name: str='cube', program_key: str='default', vbo_key: str='cube'):
         """
         Adds a new VAO with a program and VBO. Creates an empty instance buffer
         """
+
+        # Save th VAO
+        self.vaos[name] = self.get_vao(program_key, vbo_key)
+
+    def get_vao(self, program_key: str, vbo_key: str):
+        """
+        Makes a VAO of a VBO with a program. The VBO is loaded if it has not been used yet
+        """
+
         # Get program an vbo
         program = self.shader_handler.programs[program_key]
         vbo = self.vbo_handler.vbos[vbo_key]
 
-        # Make the VAO
-        vao = self.ctx.vertex_array(program, [(vbo.vbo, vbo.format, *vbo.attribs)], skip_errors=True)
+        return vbo.get_vertex_array(program)
 
-        # Save th VAO
-        self.vaos[name] = vao
+    def preload(self, keys: list):
+        """
+        Loads the VBOs of the given model names and makes their default VAOs now instead of on their first use
+        """
+
+        self.vbo_handler.preload(keys)
+        for key in keys: self.vaos[key]
     
     def release(self):
         """
@@ -1,35 +1,97 @@
 import os
 import numpy as np
-from pyobjloader import load_model
+from scripts.render.obj_loader import load_obj
+from scripts.render.mesh_simplifier import get_lods
+from scripts.render.mesh_indexer import index_mesh
+from scripts.render.mesh_cache import MeshCache
+from scripts.render.asset_bundle import AssetBundle
+from scripts.generic.data_types import LazyDict
 #from scripts.model import load_model
 from numba import njit
 
 
+def get_unique_points(vertex_data: np.ndarray) -> tuple:
+    """
+    Returns the unique points of a triangle list in the order they first appear and the index of each vertex's point
+    """
+
+    points, first, inverse = np.unique(vertex_data[:,:3], axis=0, return_index=True, return_inverse=True)
+    order = np.argsort(first)
+
+    ranks = np.empty(shape=len(order), dtype='i4')
+    ranks[order] = np.arange(len(order), dtype='i4')
+    return points[order].astype('f4'), ranks[inverse.reshape(-1)]
+
+
+def get_model_data(path: str) -> tuple:
+    """
+    Loads a model file and derives the data its VBOs are made from.
+    Returns a tuple of (dict of arrays, dict of metadata), the layout stored by the mesh cache and asset bundles.
+    MeshCache.version must be bumped when this data changes, which also makes baked asset bundles out of date.
+    """
+
+    model = load_obj(path)
+    vertices, indices = index_mesh(model.vertex_data)
+    unique_points, mesh_indicies = get_unique_points(model.vertex_data)
+    arrays = {'vertex_data': model.vertex_data, 'vertices': vertices, 'indices': indices, 'unique_points': unique_points, 'mesh_indicies': mesh_indicies}
+
+    # Simplified levels of detail
+    lods = get_lods(model.vertex_data)
+    for i, lod in enumerate(lods, 1):
+        lod_vertices, lod_indices = index_mesh(lod)
+        arrays.update({f'lod{i}_vertex_data': lod, f'lod{i}_vertices': lod_vertices, f'lod{i}_indices': lod_indices})
+
+    return arrays, {'format': model.format, 'attribs': list(model.attribs), 'lods': len(lods)}
+
+
 class VBOHandler:
     """
-    Stores all vertex buffer objects
+    Stores all vertex buffer objects. VBOs are loaded on their first use, so only the models a scene uses take load time and GPU memory.
     """
-    def __init__(self, ctx, directory='models'):
+    def __init__(self, ctx, directory='models', bundle: AssetBundle=None):
         self.ctx = ctx
         self.directory = directory
-        self.vbos = {}
-        self.vbos['cube'] = CubeVBO(self.ctx)
-        self.vbos['frame'] = FrameVBO(self.ctx)
-
+        # Baked model data is used when it is up to date with the model file
+        self.bundle = bundle
+        # Data derived from the model files is kept between runs
+        self.cache = MeshCache(os.path.join(directory, '.cache'))
+        self.vbos = LazyDict(self.load)
+
+        # Paths of the model files that can be loaded. Models in the bundle do not need their files
+        self.paths = {name: os.path.join(directory, f'{name}.obj') for name in bundle.names('models')} if bundle else {}
+        if not os.path.isdir(self.directory): return
         for file in os.listdir(self.directory):
             filename = os.fsdecode(file)
 
             if not filename.endswith(".obj"): continue
 
-            obj_file = os.path.join(directory, filename)
-            self.vbos[file[:-4]] = ModelVBO(self.ctx, obj_file)
+            self.paths[filename[:-4]] = os.path.join(directory, filename)
+
+    def load(self, key: str):
+        """
+        Creates the VBO of a built in model or a model file. Called on the first use of the key.
+        """
+
+        if key == 'cube': return CubeVBO(self.ctx)
+        if key == 'frame': return FrameVBO(self.ctx)
+        if key not in self.paths: raise KeyError(f'No model named {key} in {self.directory}')
+
+        data = self.bundle.get_model(key, self.paths[key]) if self.bundle else None
+        return ModelVBO(self.ctx, self.paths[key], self.cache, data)
+
+    def preload(self, keys: list):
+        """
+        Loads the VBOs of the given keys now instead of on their first use
+        """
+
+        for key in keys: self.vbos[key]
 
     def release(self):
         """
         Releases all VBOs in handler
         """
 
-        [vbo.vbo.release() for vbo in self.vbos.values()]
+        [lod.release() for vbo in self.vbos.values() for lod in vbo.lods]
 
 
 class BaseVBO:
@@ -40,6 +102,10 @@ class BaseVBO:
     def __init__(self, ctx):
         self.ctx = ctx
         self.vbo = self.get_vbo()
+        # Radius of the model's bounding sphere around its origin
+        self.radius = float(np.max(np.linalg.norm(self.vertex_data[:,:3], axis=1)))
+        # Levels of detail from the full mesh to the coarsest simplification
+        self.lods = [self]
         self.unique_points: list
         self.format: str = None
         self.attrib: list = None
@@ -60,22 +126,42 @@ class BaseVBO:
         """
         
         self.vertex_data = self.get_vertex_data()
-        vbo = self.ctx.buffer(self.vertex_data)
+        self.vertices, self.indices = self.get_indexed_data()
 
-        verticies = self.vertex_data[:,:3]
+        # Save the mash vertex indicies for softbody reconstruction
+        self.unique_points, self.mesh_indicies = self.get_unique_points()
 
-        self.unique_points = []
-        [self.unique_points.append(x) for x in verticies.tolist() if x not in self.unique_points]
+        # The vertices are drawn through an index buffer
+        self.ibo = self.ctx.buffer(self.indices)
+        return self.ctx.buffer(self.vertices)
 
-        # Save the mash vertex indicies for softbody reconstruction
-        self.mesh_indicies = np.zeros(shape=(len(self.vertex_data)))
-        for i, vertex in enumerate(self.vertex_data):
-            index = self.unique_points.index(vertex[:3].tolist())
-            self.mesh_indicies[i] = index
+    def get_indexed_data(self) -> tuple:
+        """
+        Returns the deduplicated vertices and the triangle indices in vertex cache friendly order.
+        The vertex data is kept as a triangle list for building combined meshes.
+        """
+
+        return index_mesh(self.vertex_data)
 
-        self.unique_points = np.array(self.unique_points, dtype='f4')
+    def get_unique_points(self) -> tuple:
+        """
+        Returns the unique points in the order they first appear and the index of each vertex's point
+        """
 
-        return vbo
+        return get_unique_points(self.vertex_data)
+
+    def get_vertex_array(self, program, *buffers):
+        """
+        Creates an indexed VAO of the VBO with a program. Buffers are extra (buffer, format, *attribs) tuples such as an instance buffer.
+        """
+
+        return self.ctx.vertex_array(program, [(self.vbo, self.format, *self.attribs), *buffers], index_buffer=self.ibo, index_element_size=self.indices.itemsize, skip_errors=True)
+
+    def release(self):
+        self.vbo.release()
+        self.ibo.release()
+        # Drop the CPU copies, which can be views of the asset bundle's memory map
+        self.vertex_data = self.vertices = self.indices = None
 
     
 class CubeVBO(BaseVBO):
@@ -152,24 +238,47 @@ class FrameVBO(BaseVBO):
     
 
 class ModelVBO(BaseVBO):
-    def __init__(self, ctx, path):
+    def __init__(self, ctx, path, cache: MeshCache=None, data: dict=None):
         self.path = path
+        # Loaded and derived data of the model. Given by an asset bundle or taken from the cache if the file has not changed since it was cached
+        self.data = data or (cache.load(path) if cache else None)
+        if self.data is None:
+            arrays, meta = get_model_data(path)
+            if cache: cache.save(path, arrays, meta)
+            self.data = {**meta, **arrays}
+
         super().__init__(ctx)
-        self.format = self.model.format
-        self.attribs = self.model.attribs
+        self.format = self.data['format']
+        self.attribs = self.data['attribs']
+        self.lods = [self, *(LodVBO(self.ctx, self.data[f'lod{i}_vertex_data'], self.format, self.attribs, (self.data[f'lod{i}_vertices'], self.data[f'lod{i}_indices'])) for i in range(1, self.data['lods'] + 1))]
+        self.data = None
         self.triangles = None
-        self.unique_points = None
 
-    def get_vbo(self):
-        """
-        Creates a buffer with the vertex data
-        """
-        
-        self.vertex_data = self.get_vertex_data()
-        vbo = self.ctx.buffer(self.vertex_data)
+    def get_vertex_data(self):
+        return self.data['vertex_data']
+
+    def get_indexed_data(self):
+        return self.data['vertices'], self.data['indices']
 
-        return vbo
+    def get_unique_points(self):
+        # Colliders keep the points for the life of the scene, so they are copied out of the bundle or cache's memory map
+        return np.array(self.data['unique_points']), np.array(self.data['mesh_indicies'])
+
+
+class LodVBO(BaseVBO):
+    """
+    Simplified mesh of a model, drawn in place of the full mesh when the model is far from the camera
+    """
+    def __init__(self, ctx, vertex_data: np.ndarray, format: str, attribs: list, indexed_data: tuple=None):
+        self.simplified_data = vertex_data
+        self.indexed_data = indexed_data  # Cached (vertices, indices) of the simplified mesh
+        super().__init__(ctx)
+        self.format = format
+        self.attribs = attribs
 
     def get_vertex_data(self):
-        self.model = load_model(self.path)
-        return self.model.vertex_data
\ No newline at end of file
+        return self.simplified_data
+
+    def get_indexed_data(self):
+        if self.indexed_data: return self.indexed_data
+        return super().get_indexed_data()
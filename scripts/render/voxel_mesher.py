@@ -0,0 +1,153 @@
+import numpy as np
+
+
+# Face directions as (axis, sign)
+DIRECTIONS = [(axis, sign) for axis in range(3) for sign in (1, -1)]
+
+
+class VoxelMesher:
+    """
+    Builds chunk meshes for axis aligned cubes on a grid.
+    Faces buried against a neighbouring cube are dropped and coplanar faces with the same texture are greedily merged into larger quads.
+    Texture coordinates keep the cube model's mapping and repeat across merged quads, so merged faces look the same as the separate cubes.
+    """
+    def __init__(self, cube_vbo, row_size: int) -> None:
+        self.row_size = row_size  # Floats per vertex in the combined mesh format
+        self.uv_maps = self.get_uv_maps(cube_vbo.vertex_data)
+
+    def get_uv_maps(self, vertex_data: np.ndarray) -> dict:
+        """
+        Fits the texture coordinates of each face of the cube model as an affine function of the vertex position.
+        Returns a dict of direction -> (4, 2) matrix mapping (x, y, z, 1) to (u, v)
+        """
+
+        uv_maps = {}
+        for axis, sign in DIRECTIONS:
+            face = vertex_data[np.isclose(vertex_data[:,5 + axis], sign)]
+            positions = np.hstack([face[:,:3], np.ones(shape=(len(face), 1))])
+
+            # The position along the face's axis is constant, so it is left out of the fit
+            positions[:,axis] = 0
+            uv_maps[(axis, sign)] = np.linalg.lstsq(positions, face[:,3:5], rcond=None)[0]
+
+        return uv_maps
+
+    def build(self, positions: np.ndarray, scales: np.ndarray, textures: np.ndarray) -> np.ndarray:
+        """
+        Returns the combined mesh data of the visible faces of the cubes.
+        Args:
+            positions: np.ndarray
+                (n, 3) centers of the cubes. Cubes with a scale of s are expected to be on a grid with a spacing of 2s.
+            scales: np.ndarray
+                (n,) uniform scale of each cube
+            textures: np.ndarray
+                (n, 2) texture of each cube
+        """
+
+        meshes = [np.empty(shape=(0, self.row_size), dtype='f4')]
+
+        # Cubes can only hide the faces of cubes with the same size
+        sizes, size_groups = np.unique(scales, return_inverse=True)
+        for i, size in enumerate(sizes.tolist()):
+            group = np.flatnonzero(size_groups == i)
+            meshes.append(self.build_grid(positions[group], size, textures[group]))
+
+        return np.vstack(meshes)
+
+    def build_grid(self, positions: np.ndarray, size: float, textures: np.ndarray) -> np.ndarray:
+        """
+        Meshes cubes of a single size
+        """
+
+        # Grid cell of each cube with a border of empty cells
+        cells = np.round(positions / (2 * size)).astype('i4')
+        origin = cells.min(axis=0) - 1
+        cells -= origin
+
+        # Cells contain the index of the cube's texture or -1 if empty
+        texture_keys, texture_ids = np.unique(textures, axis=0, return_inverse=True)
+        grid = np.full(shape=cells.max(axis=0) + 2, fill_value=-1, dtype='i4')
+        grid[cells[:,0], cells[:,1], cells[:,2]] = texture_ids.reshape(-1)
+
+        meshes = []
+        for axis, sign in DIRECTIONS:
+            # A face is visible when the neighbouring cell in its direction is empty
+            neighbours = np.roll(grid, -sign, axis=axis)
+            faces = np.where(neighbours == -1, grid, -1)
+
+            # Merge the faces of each slice perpendicular to the axis
+            slices = np.moveaxis(faces, axis, 0)
+            quads = [(layer, *quad) for layer in np.flatnonzero((slices >= 0).any(axis=(1, 2))).tolist() for quad in self.merge(slices[layer])]
+            if quads: meshes.append(self.get_quad_data(np.array(quads, dtype='i4'), axis, sign, origin, size, texture_keys))
+
+        if not meshes: return np.empty(shape=(0, self.row_size), dtype='f4')
+        return np.vstack(meshes)
+
+    @staticmethod
+    def merge(faces: np.ndarray) -> list:
+        """
+        Greedily merges rectangles of equal values in a 2D array of texture ids, where -1 is no face.
+        Returns a list of (row start, column start, row end, column end, texture id)
+        """
+
+        faces = faces.copy()
+        rows, columns = faces.shape
+        quads = []
+
+        for i in range(rows):
+            row = faces[i].tolist()
+            j = 0
+            while j < columns:
+                texture = row[j]
+                if texture < 0:
+                    j += 1
+                    continue
+
+                # Extend the quad along the row, then down over rows with the same run
+                k = j + 1
+                while k < columns and row[k] == texture: k += 1
+                l = i + 1
+                while l < rows and np.all(faces[l, j:k] == texture): l += 1
+
+                faces[i:l, j:k] = -1
+                quads.append((i, j, l, k, texture))
+                j = k
+
+        return quads
+
+    def get_quad_data(self, quads: np.ndarray, axis: int, sign: int, origin: np.ndarray, size: float, texture_keys: np.ndarray) -> np.ndarray:
+        """
+        Builds two triangles for each merged quad of a face direction
+        Args:
+            quads: np.ndarray
+                (n, 6) array of (layer, row start, column start, row end, column end, texture id) in cells of the moved axes
+        """
+
+        # The other two axes in the order of the slice's rows and columns
+        u_axis, v_axis = [a for a in range(3) if a != axis]
+
+        # Corners of each quad in cell units. Faces are half a cell from the cube's center
+        corners = np.empty(shape=(len(quads), 4, 3), dtype='f4')
+        corners[:,:,axis] = (quads[:,0] + 0.5 * sign)[:,None]
+        u_start, u_end = quads[:,1] - 0.5, quads[:,3] - 0.5
+        v_start, v_end = quads[:,2] - 0.5, quads[:,4] - 0.5
+        corners[:,:,u_axis] = np.stack([u_start, u_end, u_end, u_start], axis=1)
+        corners[:,:,v_axis] = np.stack([v_start, v_start, v_end, v_end], axis=1)
+
+        # Wind the triangles counter clockwise when seen from outside the face
+        normal = np.zeros(shape=3, dtype='f4')
+        normal[axis] = sign
+        if np.dot(np.cross(corners[0,1] - corners[0,0], corners[0,2] - corners[0,0]), normal) < 0: corners = corners[:,::-1]
+        corners = corners[:,[0, 1, 2, 0, 2, 3]].reshape(-1, 3)
+
+        # Create the mesh rows. The vertices are in world space, so the model data is the identity
+        data = np.zeros(shape=(len(corners), self.row_size), dtype='f4')
+        data[:,:3] = (corners + origin) * 2 * size
+
+        # Texture coordinates use the positions relative to the grid so they stay small. The offset is a whole number of texture repeats
+        data[:,3:5] = np.hstack([corners * 2, np.ones(shape=(len(corners), 1))]) @ self.uv_maps[(axis, sign)]
+        data[:,5:8] = normal
+        data[:,14:17] = 1
+        data[:,17:19] = np.repeat(texture_keys[quads[:,5]], 6, axis=0)
+
+        return data
@@ -7,7 +7,7 @@ from scripts.physics.physics_body_handler import PhysicsBodyHandler
 from scripts.collections.collection_handler import *
 from scripts.skeletons.skeleton_handler import SkeletonHandler
 import glm
-from random import uniform, randrange
+from random import uniform
 
 class Scene:
     def __init__(self, engine, project) -> None:
@@ -215,6 +215,7 @@ class Scene:
         self.vao_handler.shader_handler.write_all_uniforms()
         self.project.texture_handler.write_textures()
         self.project.texture_handler.write_textures('batch')
+        self.project.texture_handler.write_textures('instance')
 
     def update(self):
         """
@@ -223,8 +224,7 @@ class Scene:
         
         if self.engine.keys[pg.K_e]:
             place_range = 100
-            for i in range(100):
-                self.object_handler.add(position=(self.camera.position.x + randrange(-place_range, place_range), self.camera.position.y + randrange(-place_range, place_range), self.camera.position.z + randrange(-place_range, place_range)))
+            self.object_handler.add_many(positions=np.array(self.camera.position) + np.random.randint(-place_range, place_range, size=(100, 3)))
         
         self.selected_object.scale.x += (self.engine.keys[pg.K_UP] - self.engine.keys[pg.K_DOWN]) * self.engine.dt * 10
         self.selected_object.scale.z += (self.engine.keys[pg.K_RIGHT] - self.engine.keys[pg.K_LEFT]) * self.engine.dt * 10
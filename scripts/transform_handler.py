@@ -1,5 +1,17 @@
+import time
 import moderngl as mgl
 import numpy as np
+from scripts.generic.math_functions import get_model_matrices
+
+
+def model_transform(data: np.ndarray) -> np.ndarray:
+    """
+    NumPy version of the model_transform shader. Takes the same (n, 12) rows of (point, position, rotation, scale) and returns the same flat (n * 3) output.
+    """
+
+    model = get_model_matrices(data[:,3:6], data[:,6:9], data[:,9:12])[0].reshape(-1, 4, 4)
+    # Matrices are column major, so a point is transformed by summing the columns scaled by its coordinates
+    return (np.einsum('nc,ncr->nr', data[:,:3], model[:,:3,:3]) + model[:,3,:3]).reshape(-1)
 
 
 class TransformHandler:
@@ -12,16 +24,78 @@ class TransformHandler:
         self.transforms = {}
         self.programs = {}
 
+        # NumPy versions of the transforms and the batch sizes up to which they are faster than the GPU
+        self.cpu_transforms = {'model_transform': model_transform}
+        self.cpu_limits = {}
+
+        # Without a GL context every transform runs on the CPU
+        if self.ctx is None:
+            self.cpu_limits = {key: np.inf for key in self.cpu_transforms}
+            return
+
         # Load defaults
         self.load_transform('model_transform', 'model_transform', ['position'], '3f 3f 3f 3f', ('in_position', 'obj_position', 'obj_rotation', 'obj_scale'))
+        self.calibrate('model_transform', self.get_model_transform_sample)
 
     def transform(self, transform_key, data):
         """
-        Transforms the given data using the specified transform
+        Transforms the given data using the specified transform.
+        Batches up to the transform's calibrated limit run on the CPU, larger batches on the GPU.
         """
         
+        if len(data) <= self.cpu_limits.get(transform_key, 0): return self.cpu_transforms[transform_key](np.asarray(data, dtype='f4'))
         return self.transforms[transform_key].transform(data)
 
+    def calibrate(self, transform_key: str, get_sample, sizes: tuple=(16, 64, 256, 1024, 4096, 16384), repeats: int=3, tolerance: float=1e-4) -> None:
+        """
+        Times the CPU and GPU versions of a transform on growing batches to find the batch size up to which the CPU is faster.
+        The outputs are compared on every batch. If they differ, the transform is kept on the GPU.
+        Args:
+            get_sample: function
+                Takes a batch size and returns a batch of input rows
+            tolerance: float
+                Largest allowed difference between the outputs, relative to the largest output value
+        """
+
+        self.cpu_limits[transform_key] = 0
+        for size in sizes:
+            data = get_sample(size)
+            cpu_time, cpu_output = self.time_transform(self.cpu_transforms[transform_key], data, repeats)
+            gpu_time, gpu_output = self.time_transform(self.transforms[transform_key].transform, data, repeats)
+
+            if np.max(np.abs(cpu_output - gpu_output)) > tolerance * max(np.max(np.abs(gpu_output)), 1):
+                self.cpu_limits[transform_key] = 0
+                return
+
+            if cpu_time > gpu_time: return
+            self.cpu_limits[transform_key] = size
+
+    def time_transform(self, transform, data: np.ndarray, repeats: int) -> tuple:
+        """
+        Returns a tuple of (fastest time of the repeats, copy of the output)
+        """
+
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            output = transform(data)
+            times.append(time.perf_counter() - start)
+
+        return min(times), np.array(output)
+
+    def get_model_transform_sample(self, size: int) -> np.ndarray:
+        """
+        Returns random model_transform rows with the value ranges of colliders
+        """
+
+        random = np.random.default_rng(size)
+        data = np.empty(shape=(size, 12), dtype='f4')
+        data[:,0:3]  = random.uniform(-1, 1, size=(size, 3))
+        data[:,3:6]  = random.uniform(-100, 100, size=(size, 3))
+        data[:,6:9]  = random.uniform(-np.pi, np.pi, size=(size, 3))
+        data[:,9:12] = random.uniform(0.1, 10, size=(size, 3))
+        return data
+
     def load_transform(self, name: str, program_name: str, output: list, format: str, attribs: iter):
         """
         Loads a transformation shader. 
@@ -59,29 +133,46 @@ class TransformHandler:
 class Transform:
     def __init__(self, ctx, program, format, attribs, output_size=3, buffer_reserve=1000000) -> None:
         """
-        Container for all the data needed with a loaded transformation shader
+        Container for all the data needed with a loaded transformation shader.
+        The input and output buffers and the array the output is read into are kept between calls and grown when a call needs more room.
         """
         
         self.ctx = ctx
         self.output_size = output_size
         self.input_buffer = ctx.buffer(reserve=buffer_reserve)
+        self.output_buffer = ctx.buffer(reserve=buffer_reserve)
+        self.output_data = np.empty(shape=buffer_reserve // 4, dtype='f4')
         self.vao = ctx.vertex_array(program, [(self.input_buffer, format, *attribs)])
 
+    def reserve(self, buffer, size: int) -> None:
+        """
+        Orphans the buffer so writing to it does not wait for the GPU to finish the last transform.
+        The buffer is at least doubled if it is smaller than size. Orphaning keeps the buffer object, so the vao stays valid.
+        """
+
+        buffer.orphan(max(size, buffer.size * 2) if size > buffer.size else -1)
+
     def transform(self, data):
         """
-        Transforms the given data according to the current parameters
+        Transforms the given data according to the current parameters.
+        Returns a flat array of the output. The array is reused, so it is only valid until the next call.
         """
         
         # Get the number of vertices
         N = len(data)
+        data = np.ascontiguousarray(data, dtype='f4')
+        output_bytes = N * self.output_size * 4
 
         # Write the input data to the vao buffer
+        self.reserve(self.input_buffer, data.nbytes)
         self.input_buffer.write(data)
 
         # Transform the data and read from buffer to np array
-        output_data = self.ctx.buffer(np.zeros(shape=(N, self.output_size), dtype='f4'))
-        output_data = self.ctx.buffer(reserve=(N * self.output_size * 4))
-        self.vao.transform(output_data, vertices=N)
-        output_data = np.frombuffer(output_data.read(), 'f4')
+        self.reserve(self.output_buffer, output_bytes)
+        self.vao.transform(self.output_buffer, vertices=N)
+
+        if output_bytes > self.output_data.nbytes: self.output_data = np.empty(shape=max(output_bytes, self.output_data.nbytes * 2) // 4, dtype='f4')
+        output_data = self.output_data[:N * self.output_size]
+        self.output_buffer.read_into(output_data, size=output_bytes)
 
-        return output_data
\ No newline at end of file
+        return output_data
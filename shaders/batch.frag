@@ -11,9 +11,14 @@ struct textArray {
 };
 
 uniform textArray textureArrays[5];
+uniform isampler2D layerMap;
 
 
 void main() {
-    fragColor = texture(textureArrays[int(round(textureID.x))].array, vec3(uv, round(textureID.y)));
+    // Texture ids are (array, layer). The layer map gives the layer's slot in the array, or -1 if it is not resident
+    int array = int(round(textureID.x));
+    int slot = texelFetch(layerMap, ivec2(int(round(textureID.y)), array), 0).r;
+    if (slot < 0) fragColor = vec4(0.5, 0.5, 0.5, 1.0);
+    else fragColor = texture(textureArrays[array].array, vec3(uv, slot));
     fragColor.rgb *= shading;
 }
\ No newline at end of file
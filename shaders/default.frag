@@ -12,9 +12,14 @@ struct textArray {
 };
 
 uniform textArray textureArrays[5];
+uniform isampler2D layerMap;
 
 
 void main() {
-    fragColor = texture(textureArrays[int(textureID.x)].array, vec3(uv, textureID.y));
+    // Texture ids are (array, layer). The layer map gives the layer's slot in the array, or -1 if it is not resident
+    int array = int(textureID.x);
+    int slot = texelFetch(layerMap, ivec2(int(textureID.y), array), 0).r;
+    if (slot < 0) fragColor = vec4(0.5, 0.5, 0.5, 1.0);
+    else fragColor = texture(textureArrays[array].array, vec3(uv, slot));
     fragColor.rgb *= shading;
 }
\ No newline at end of file
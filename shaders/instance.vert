@@ -0,0 +1,25 @@
+#version 330 core
+
+layout (location = 0) in vec3 in_position;
+layout (location = 1) in vec2 in_uv;
+layout (location = 2) in vec3 in_normal;
+
+layout (location = 3) in mat4 obj_model;
+layout (location = 7) in mat3 obj_normal;
+layout (location = 10) in vec2 obj_texture;
+
+out vec2 uv;
+out float shading;
+out vec2 textureID;
+
+uniform mat4 m_proj;
+uniform mat4 m_view;
+
+void main() {
+    uv = in_uv;
+    vec3 normal = normalize(obj_normal * in_normal);
+    shading = ((dot(vec3(.5, .25, .75), normal) + 1) / 2) * .75 + .25;
+    textureID = obj_texture;
+
+    gl_Position = m_proj * m_view * obj_model * vec4(in_position, 1.0);
+}
\ No newline at end of file